@@ -2,9 +2,10 @@ import discord
 from discord.ext import commands
 from datetime import datetime
 import random
+import bisect
 import config
 from googletrans import Translator
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
 from typing import Dict
 from datetime import timedelta
 import re
@@ -13,10 +14,36 @@ import aiohttp
 from typing import Dict, Union, List
 import json
 import logging
+import logging.handlers
+import queue
+import gzip
+import io
+import shutil
+import atexit
+import contextvars
+import uuid
+import tempfile
 import sys
+import sqlite3
+import threading
+import os
+import time
 from random import randint, choice
 from asyncio import create_task
 from functools import wraps
+from contextlib import contextmanager
+from aiohttp import web
+from datetime import timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # Channel exports fall back to gzip
+
+try:
+    import emoji as emoji_data
+except ImportError:
+    emoji_data = None  # Unicode emojis are checked by is_unicode_emoji's rules instead
 
 
 intents = discord.Intents.default()
@@ -24,79 +51,1024 @@ intents.message_content = True
 intents.members = True
 
 bot = commands.Bot(command_prefix=',', intents=intents)
-deleted_messages = defaultdict(lambda: None)
+SNIPE_DEPTH = 10  # Deleted messages remembered per channel
+SNIPE_MAX_CHANNELS = 500  # Channels with snipe history, least recently used are dropped first
+SNIPE_TTL = 60 * 60  # Seconds a deleted message stays snipeable
+MESSAGE_CACHE_ENABLED = getattr(config, 'MESSAGE_CACHE_ENABLED', False)  # Keep content of recent messages for snipe
+MESSAGE_CACHE_BUDGET = getattr(config, 'MESSAGE_CACHE_BUDGET', 512 * 1024)  # Bytes of cached messages per guild
+MESSAGE_CACHE_RECORD_OVERHEAD = 150  # Estimated bytes per cached message besides its text
 autoresponders: Dict[int, Dict[str, Union[str, List[str]]]] = {}  # {guild_id: {trigger: response/reactions}}
+autoresponder_matchers = {}  # {guild_id: TriggerMatcher} compiled from autoresponders
 reaction_roles = {}  # {message_id: {emoji: role_id}}
 
-xp_data = {}  # {guild_id: {user_id: {"xp": amount, "level": level, "last_msg": timestamp}}}
+xp_shards = {}  # {guild_id: XPShard} for guilds whose XP data is in memory
 XP_COOLDOWN = 60  # Seconds between XP gains
 MIN_XP = 15  # Minimum XP per message
 MAX_XP = 25  # Maximum XP per message
 
+levelup_channels = {}  # {guild_id: channel_id}, 0 turns level-up announcements off
+pending_levelups = {}  # {channel_id: [(user_id, level, xp)]} waiting to be announced
+LEVELUP_FLUSH_DELAY = 3  # Seconds to collect level-ups in a channel before announcing them
+LEVELUPS_PER_EMBED = 20
+LEVELUP_EMBEDS_PER_MESSAGE = 4
+
+LOG_DIGEST_INTERVAL = 30  # Seconds log messages wait to be sent as one digest DM
+LOG_DIGEST_MAX_CHARS = 3500  # Send a digest early once it holds this much text
+
+METRICS_PORT = getattr(config, 'METRICS_PORT', None)  # Serve Prometheus metrics on this port when set
+METRICS_HOST = getattr(config, 'METRICS_HOST', '127.0.0.1')
+HTTP_TIMEOUT = 10  # Seconds an outbound HTTP request may take in total
+HTTP_CONNECT_TIMEOUT = 5  # Seconds to get a connection, including DNS and TLS
+HTTP_CONNECTIONS_PER_HOST = 10  # Pooled keep-alive connections per upstream host
+HTTP_DNS_CACHE_TTL = 300  # Seconds resolved addresses are reused
+http_session = None  # Shared aiohttp session for outbound requests, created in setup_hook
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
 last_save_time = datetime.utcnow()
 AUTOSAVE_INTERVAL = timedelta(minutes=5)  # Save every 5 minutes
 
+XP_SHARD_DIR = getattr(config, 'XP_SHARD_DIR', 'xp_data')  # One snapshot and log per guild
+XP_SHARD_IDLE_TIMEOUT = getattr(config, 'XP_SHARD_IDLE_TIMEOUT', 30 * 60)  # Seconds before an unused shard is evicted
+XP_LOG_COMPACT_ENTRIES = 10000  # Compact a shard early if its log grows past this many entries
+XP_LOG_FILE = 'xp_data.log'  # Pre-shard XP log, only read to migrate
+XP_LOG_OLD_FILE = 'xp_data.log.old'
+
+XP_BACKEND = getattr(config, 'XP_BACKEND', 'json')  # 'json' or 'sqlite'
+XP_DB_FILE = getattr(config, 'XP_DB_FILE', 'xp_data.db')
+XP_DB_BATCH_SIZE = 500  # Flush pending SQLite writes once this many users changed
+XP_DB_FLUSH_DELAY = 5  # Seconds a pending SQLite write may wait before being flushed
+
 def calculate_level(xp):
     """Calculate level based on XP amount"""
     return int((xp / 100) ** 0.5)
 
-def save_xp_data():
-    """Save XP data to JSON file"""
-    with open('xp_data.json', 'w') as f:
-        # Convert datetime objects to strings
-        data = {}
-        for guild_id, guild_data in xp_data.items():
-            data[str(guild_id)] = {}
-            for user_id, user_data in guild_data.items():
-                data[str(guild_id)][str(user_id)] = {
-                    "xp": user_data["xp"],
-                    "level": user_data["level"],
-                    "last_msg": user_data["last_msg"].isoformat() if user_data["last_msg"] else None
-                }
+class XPRecord:
+    """A member's XP state, last_msg is the epoch time of their last XP gain"""
+    __slots__ = ('xp', 'level', 'last_msg')
+
+    def __init__(self, xp=0, level=0, last_msg=None):
+        self.xp = xp
+        self.level = level
+        self.last_msg = last_msg
+
+def parse_last_msg(value):
+    """Convert a stored last_msg (epoch seconds or an older ISO string) to epoch seconds"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+metrics = []  # Every metric rendered by the metrics endpoint
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+class Counter:
+    """Prometheus counter with optional labels"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}  # {((label, value), ...): count}
+        metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{format_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+class Histogram:
+    """Prometheus histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {}  # {labels: [bucket counts..., sum, count]}
+        metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key, [('le', '+Inf')])} {counts[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {counts[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {counts[-1]}")
+        return lines
+
+class CallbackMetric:
+    """Metric read at scrape time, callback returns {label value: number} for one label"""
+
+    def __init__(self, name, help_text, metric_type, label, callback):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label = label
+        self.callback = callback
+        metrics.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        lines += [f"{self.name}{format_labels([(self.label, key)])} {value}"
+                  for key, value in self.callback().items()]
+        return lines
+
+event_latency = Histogram("bot_event_duration_seconds", "Time spent in gateway event handlers")
+command_latency = Histogram("bot_command_duration_seconds", "Time spent running commands")
+save_latency = Histogram("bot_save_duration_seconds", "Time spent writing persisted data")
+autoresponder_checks = Counter("bot_autoresponder_checks_total", "Messages checked against autoresponder triggers")
+autoresponder_matches = Counter("bot_autoresponder_matches_total", "Messages that matched an autoresponder trigger")
+lookup_cache_requests = Counter("bot_lookup_cache_requests_total", "Dictionary lookups by cache and result")
+
+def timed_event(func):
+    """Record an event handler's latency in event_latency"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            event_latency.observe(time.perf_counter() - start, event=func.__name__)
+    return wrapper
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so a crash never leaves a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class SnapshotWriter:
+    """Persist data by taking a snapshot on the event loop and writing it in a worker thread
+    Requests made while a write is running are coalesced into one follow-up write"""
+
+    def __init__(self, name, snapshot, write):
+        self.name = name  # Label for save_latency
+        self.snapshot = snapshot  # Runs on the loop, must only copy
+        self.write = write  # Runs in a worker thread with the snapshot
+        self.requested = False
+        self.task = None
+
+    def request(self):
+        """Schedule a save, the returned task finishes once the data has been written"""
+        self.requested = True
+        if self.task is None or self.task.done():
+            self.task = create_task(self._run())
+        return self.task
+
+    async def _run(self):
+        while self.requested:
+            self.requested = False
+            start = time.perf_counter()
+            await asyncio.to_thread(self.write, self.snapshot())
+            save_latency.observe(time.perf_counter() - start, store=self.name)
+
+def read_xp_log(path, records):
+    """Replay an XP log into records, returning the number of entries read"""
+    # Each log entry holds a user's full state, so replaying in order is enough
+    entries = 0
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    user_id, xp, level, last_msg = json.loads(line)
+                except ValueError:
+                    continue  # Partially written entry from a crash
+                records[user_id] = XPRecord(xp, level, parse_last_msg(last_msg))
+                entries += 1
+    except FileNotFoundError:
+        pass
+    return entries
 
-def load_xp_data():
-    """Load XP data from JSON file"""
+def load_legacy_xp_data():
+    """Load XP data from the pre-shard xp_data.json and XP log"""
+    result = {}
     try:
         with open('xp_data.json', 'r') as f:
             data = json.load(f)
-            # Convert string timestamps back to datetime
-            result = {}
             for guild_id, guild_data in data.items():
                 result[int(guild_id)] = {}
                 for user_id, user_data in guild_data.items():
-                    result[int(guild_id)][int(user_id)] = {
-                        "xp": user_data["xp"],
-                        "level": user_data["level"],
-                        "last_msg": datetime.fromisoformat(user_data["last_msg"]) if user_data["last_msg"] else None
-                    }
-            return result
+                    result[int(guild_id)][int(user_id)] = XPRecord(
+                        user_data["xp"],
+                        user_data["level"],
+                        parse_last_msg(user_data["last_msg"])
+                    )
+    except FileNotFoundError:
+        pass
+
+    for log_file in (XP_LOG_OLD_FILE, XP_LOG_FILE):
+        try:
+            with open(log_file, 'r') as f:
+                for line in f:
+                    try:
+                        guild_id, user_id, xp, level, last_msg = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written entry from a crash
+                    result.setdefault(guild_id, {})[user_id] = XPRecord(xp, level, parse_last_msg(last_msg))
+        except FileNotFoundError:
+            pass
+    return result
+
+def load_xp_data():
+    """Load every guild's XP data from the shard files and any pre-shard xp_data.json"""
+    result = load_legacy_xp_data()
+    if os.path.isdir(XP_SHARD_DIR):
+        for name in os.listdir(XP_SHARD_DIR):
+            if name.endswith('.json'):
+                guild_id = int(name[:-len('.json')])
+                result[guild_id] = XPShard.read(guild_id)[0]
+    return result
+
+RANK_INDEX_BLOCK = 1000  # Keys per block, blocks split in two once they hold twice this many
+
+class RankIndex:
+    """Order-statistic index of a guild's members by XP, highest first
+    Keys live in sorted blocks, so lookups bisect to a block and only count the blocks before it"""
+
+    def __init__(self, keys=()):
+        keys = list(keys)  # (-xp, user_id), already sorted
+        self.blocks = [keys[i:i + RANK_INDEX_BLOCK] for i in range(0, len(keys), RANK_INDEX_BLOCK)]
+        self.maxes = [block[-1] for block in self.blocks]  # Last key of each block
+        self.keys = {key[1]: key for key in keys}  # {user_id: (-xp, user_id)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, user_id, xp):
+        """Insert a member or move them to their new XP"""
+        key = (-xp, user_id)
+        old_key = self.keys.get(user_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._remove(old_key)
+        self._insert(key)
+        self.keys[user_id] = key
+
+    def position(self, user_id):
+        """Return the member's 0-based position in the ranking"""
+        key = self.keys[user_id]
+        i = bisect.bisect_left(self.maxes, key)
+        return sum(len(block) for block in self.blocks[:i]) + bisect.bisect_left(self.blocks[i], key)
+
+    def page(self, offset, limit):
+        """Return up to limit user IDs starting at a 0-based position"""
+        user_ids = []
+        for block in self.blocks:
+            if offset >= len(block):
+                offset -= len(block)
+                continue
+            user_ids += [key[1] for key in block[offset:offset + limit - len(user_ids)]]
+            offset = 0
+            if len(user_ids) >= limit:
+                break
+        return user_ids
+
+    def _insert(self, key):
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[i]
+        bisect.insort(block, key)
+        self.maxes[i] = block[-1]
+        if len(block) > 2 * RANK_INDEX_BLOCK:
+            self.blocks[i:i + 1] = [block[:RANK_INDEX_BLOCK], block[RANK_INDEX_BLOCK:]]
+            self.maxes[i:i + 1] = [block[RANK_INDEX_BLOCK - 1], block[-1]]
+
+    def _remove(self, key):
+        i = bisect.bisect_left(self.maxes, key)
+        block = self.blocks[i]
+        del block[bisect.bisect_left(block, key)]
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+class XPShard:
+    """One guild's XP records, persisted to its own snapshot file and log"""
+
+    def __init__(self, guild_id, records, log_entries=0):
+        self.guild_id = guild_id
+        self.records = records  # {user_id: XPRecord}
+        self.index = None  # RankIndex, built the first time the guild is ranked
+        self.index_task = None  # Builds the RankIndex in a worker thread
+        self.index_changes = set()  # Members updated while the index was being built
+        self.dirty = False  # Changed since the last snapshot
+        self.last_used = time.monotonic()
+        self.log = None
+        self.log_entries = log_entries
+        self.writer = SnapshotWriter("xp", self._snapshot, self._write)
+        self.path, self.log_path, self.old_log_path = XPShard.paths(guild_id)
+
+    @staticmethod
+    def paths(guild_id):
+        base = os.path.join(XP_SHARD_DIR, str(guild_id))
+        return f"{base}.json", f"{base}.log", f"{base}.log.old"
+
+    @staticmethod
+    def read(guild_id):
+        """Load a shard's snapshot and replay its logs, returning (records, log entries)"""
+        path, log_path, old_log_path = XPShard.paths(guild_id)
+        records = {}
+        try:
+            with open(path, 'r') as f:
+                for user_id, user_data in json.load(f).items():
+                    records[int(user_id)] = XPRecord(
+                        user_data["xp"],
+                        user_data["level"],
+                        parse_last_msg(user_data["last_msg"])
+                    )
+        except FileNotFoundError:
+            pass
+        log_entries = read_xp_log(old_log_path, records) + read_xp_log(log_path, records)
+        return records, log_entries
+
+    @staticmethod
+    def encode(records):
+        return {str(user_id): {"xp": xp, "level": level, "last_msg": last_msg}
+                for user_id, xp, level, last_msg in records}
+
+    async def rank_index(self):
+        if self.index is None:
+            if self.index_task is None:
+                self.index_task = create_task(self._build_index())
+            await self.index_task
+        return self.index
+
+    async def _build_index(self):
+        # Sorting and linking a large guild takes too long for the event loop
+        try:
+            keys = [(-user_data.xp, user_id) for user_id, user_data in self.records.items()]
+            index = await asyncio.to_thread(lambda: RankIndex(sorted(keys)))
+            for user_id in self.index_changes:
+                index.set(user_id, self.records[user_id].xp)
+            self.index = index
+        finally:
+            self.index_changes.clear()
+            self.index_task = None
+
+    def append(self, user_id, user_data):
+        """Append a user's current XP state to the shard's log"""
+        if self.log is None:
+            self.log = open(self.log_path, 'a')
+        self.log.write(json.dumps([user_id, user_data.xp, user_data.level, user_data.last_msg],
+                                  separators=(',', ':')) + '\n')
+        self.log.flush()
+        self.log_entries += 1
+        self.dirty = True
+        if self.index is not None:
+            self.index.set(user_id, user_data.xp)
+        elif self.index_task is not None:
+            self.index_changes.add(user_id)
+
+        if self.log_entries >= XP_LOG_COMPACT_ENTRIES:
+            self.save()
+
+    def save(self):
+        """Fold the log into a fresh snapshot without blocking the event loop"""
+        return self.writer.request()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def _snapshot(self):
+        self.close()
+        # If an older segment is still waiting, keep appending, replaying extra entries is harmless
+        if not os.path.exists(self.old_log_path) and os.path.exists(self.log_path):
+            os.replace(self.log_path, self.old_log_path)
+        self.log_entries = 0
+        self.dirty = False
+        return [(user_id, user_data.xp, user_data.level, user_data.last_msg)
+                for user_id, user_data in self.records.items()]
+
+    def _write(self, snapshot):
+        write_json_atomic(self.path, XPShard.encode(snapshot))
+
+        # Everything in the old log segment is now part of the snapshot
+        if os.path.exists(self.old_log_path):
+            os.remove(self.old_log_path)
+
+class JsonXPStore:
+    """XP storage in per-guild JSON shards, loaded on demand and evicted when idle"""
+
+    def __init__(self):
+        self.loading = {}  # {guild_id: Task} for shards being read from disk
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        os.makedirs(XP_SHARD_DIR, exist_ok=True)
+
+        # Split a pre-shard xp_data.json into one shard per guild
+        legacy_files = [f for f in ('xp_data.json', XP_LOG_OLD_FILE, XP_LOG_FILE) if os.path.exists(f)]
+        if legacy_files:
+            for guild_id, records in load_legacy_xp_data().items():
+                path = XPShard.paths(guild_id)[0]
+                if not os.path.exists(path):
+                    write_json_atomic(path, XPShard.encode(
+                        (user_id, user_data.xp, user_data.level, user_data.last_msg)
+                        for user_id, user_data in records.items()
+                    ))
+            for path in legacy_files:
+                os.replace(path, f"{path}.migrated")
+
+    async def shard(self, guild_id):
+        """Return a guild's shard, reading it from disk on first use"""
+        shard = xp_shards.get(guild_id)
+        if shard is None:
+            task = self.loading.get(guild_id)
+            if task is None:
+                task = self.loading[guild_id] = create_task(self._load_shard(guild_id))
+            shard = await task
+        shard.last_used = time.monotonic()
+        return shard
+
+    async def _load_shard(self, guild_id):
+        try:
+            records, log_entries = await asyncio.to_thread(XPShard.read, guild_id)
+            shard = xp_shards[guild_id] = XPShard(guild_id, records, log_entries)
+            return shard
+        finally:
+            del self.loading[guild_id]
+
+    async def get(self, guild_id, user_id):
+        return (await self.shard(guild_id)).records.get(user_id)
+
+    async def get_or_create(self, guild_id, user_id):
+        records = (await self.shard(guild_id)).records
+        user_data = records.get(user_id)
+        if user_data is None:
+            user_data = records[user_id] = XPRecord()
+        return user_data
+
+    def update(self, guild_id, user_id, user_data):
+        xp_shards[guild_id].append(user_id, user_data)
+
+    async def count(self, guild_id):
+        return len(await (await self.shard(guild_id)).rank_index())
+
+    async def top(self, guild_id, offset, limit):
+        shard = await self.shard(guild_id)
+        return [(user_id, shard.records[user_id]) for user_id in (await shard.rank_index()).page(offset, limit)]
+
+    async def position(self, guild_id, user_id):
+        """Return (1-based position, ranked members) for a member"""
+        index = await (await self.shard(guild_id)).rank_index()
+        if user_id not in index.keys:
+            return None, len(index)
+        return index.position(user_id) + 1, len(index)
+
+    def size(self):
+        return {
+            "guilds_loaded": len(xp_shards),
+            "members_loaded": sum(len(shard.records) for shard in xp_shards.values())
+        }
+
+    async def flush(self):
+        """Save dirty shards and evict shards that have been idle too long"""
+        await asyncio.gather(*(shard.save() for shard in xp_shards.values() if shard.dirty))
+
+        cutoff = time.monotonic() - XP_SHARD_IDLE_TIMEOUT
+        for guild_id, shard in list(xp_shards.items()):
+            writing = shard.writer.task is not None and not shard.writer.task.done()
+            if shard.last_used < cutoff and not shard.dirty and not writing:
+                shard.close()
+                del xp_shards[guild_id]
+
+class SqliteXPStore:
+    """XP storage in an SQLite database with writes batched off the event loop"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.lock = threading.Lock()  # One statement at a time on the shared connection
+        self.pending = {}  # {(guild_id, user_id): XPRecord} not yet written
+        self.writing = {}  # Batch being written by flush, still readable until it lands
+        self.cache = OrderedDict()  # Recently used rows, so cooldown checks skip the database
+        self.cache_size = 10000
+        self.flush_task = None
+        self.batch_flush_queued = False  # A full batch already has a flush on the way
+        self.flush_lock = asyncio.Lock()  # Keeps batches landing in the order they were taken
+
+    def load(self):
+        if self.db is not None:
+            return
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS xp ("
+            "guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+            "xp INTEGER NOT NULL, level INTEGER NOT NULL, last_msg REAL, "
+            "PRIMARY KEY (guild_id, user_id))"
+        )
+        # Ties are ranked by user ID everywhere, so the index covers that order too
+        self.db.execute("DROP INDEX IF EXISTS xp_rank")
+        self.db.execute("CREATE INDEX IF NOT EXISTS xp_rank_user ON xp (guild_id, xp DESC, user_id)")
+
+        # Import existing JSON data the first time the database is used
+        if self.db.execute("SELECT 1 FROM xp LIMIT 1").fetchone() is None:
+            rows = [self._row(guild_id, user_id, user_data)
+                    for guild_id, guild_data in load_xp_data().items()
+                    for user_id, user_data in guild_data.items()]
+            self._write(rows)
+
+    @staticmethod
+    def _row(guild_id, user_id, user_data):
+        return (guild_id, user_id, user_data.xp, user_data.level, user_data.last_msg)
+
+    def _query(self, sql, params):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _write(self, rows):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO xp (guild_id, user_id, xp, level, last_msg) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+                "xp = excluded.xp, level = excluded.level, last_msg = excluded.last_msg",
+                rows
+            )
+
+    def _remember(self, key, user_data):
+        self.cache[key] = user_data
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def get(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        user_data = self.pending.get(key)
+        if user_data is None:
+            user_data = self.writing.get(key)
+        if user_data is None:
+            user_data = self.cache.get(key)
+            if user_data is not None:
+                self.cache.move_to_end(key)
+        if user_data is not None:
+            return user_data
+
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT xp, level, last_msg FROM xp WHERE guild_id = ? AND user_id = ?",
+            key
+        )
+        if not rows:
+            return None
+        user_data = XPRecord(*rows[0])
+        self._remember(key, user_data)
+        return user_data
+
+    async def get_or_create(self, guild_id, user_id):
+        user_data = await self.get(guild_id, user_id)
+        if user_data is None:
+            user_data = XPRecord()
+            self._remember((guild_id, user_id), user_data)
+        return user_data
+
+    def size(self):
+        return {"members_cached": len(self.cache), "writes_pending": len(self.pending)}
+
+    def update(self, guild_id, user_id, user_data):
+        self.pending[(guild_id, user_id)] = user_data
+        if len(self.pending) >= XP_DB_BATCH_SIZE:
+            if not self.batch_flush_queued:
+                self.batch_flush_queued = True
+                create_task(self.flush())
+        elif self.flush_task is None:
+            self.flush_task = create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(XP_DB_FLUSH_DELAY)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            self.batch_flush_queued = False
+            if not self.pending:
+                return
+            self.writing, self.pending = self.pending, {}
+            rows = [self._row(guild_id, user_id, user_data)
+                    for (guild_id, user_id), user_data in self.writing.items()]
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception:
+                # Keep the batch for the next flush, newer pending changes win
+                self.pending = {**self.writing, **self.pending}
+                raise
+            finally:
+                self.writing = {}
+            save_latency.observe(time.perf_counter() - start, store="xp_sqlite")
+
+    async def count(self, guild_id):
+        await self.flush()
+        rows = await asyncio.to_thread(self._query, "SELECT COUNT(*) FROM xp WHERE guild_id = ?", (guild_id,))
+        return rows[0][0]
+
+    async def top(self, guild_id, offset, limit):
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT user_id, xp, level FROM xp WHERE guild_id = ? ORDER BY xp DESC, user_id LIMIT ? OFFSET ?",
+            (guild_id, limit, offset)
+        )
+        return [(user_id, XPRecord(xp, level)) for user_id, xp, level in rows]
+
+    async def position(self, guild_id, user_id):
+        """Return (1-based position, ranked members) for a member"""
+        user_data = await self.get(guild_id, user_id)
+        total = await self.count(guild_id)
+        if user_data is None:
+            return None, total
+        # Ties are ordered by user ID, matching RankIndex
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT COUNT(*) FROM xp WHERE guild_id = ? AND (xp > ? OR (xp = ? AND user_id < ?))",
+            (guild_id, user_data.xp, user_data.xp, user_id)
+        )
+        return rows[0][0] + 1, total
+
+xp_store = SqliteXPStore(XP_DB_FILE) if XP_BACKEND == 'sqlite' else JsonXPStore()
+
+def load_levelup_channels():
+    """Load level-up announcement settings from JSON file"""
+    try:
+        with open('levelup_channels.json', 'r') as f:
+            return {int(guild_id): channel_id for guild_id, channel_id in json.load(f).items()}
     except FileNotFoundError:
         return {}
 
+levelup_channels_writer = SnapshotWriter(
+    "levelup_channels",
+    lambda: {str(guild_id): channel_id for guild_id, channel_id in levelup_channels.items()},
+    lambda data: write_json_atomic('levelup_channels.json', data)
+)
+
+def queue_levelup(guild_id, channel_id, user_id, level, xp):
+    """Queue a level-up announcement, level-ups in the same channel are sent together"""
+    levelup_channel_id = levelup_channels.get(guild_id)
+    if levelup_channel_id == 0:
+        return
+    channel = bot.get_channel(levelup_channel_id) if levelup_channel_id else None
+    channel = channel or bot.get_channel(channel_id)
+    if channel is None:
+        return
+
+    if channel.id not in pending_levelups:
+        pending_levelups[channel.id] = []
+        create_task(flush_levelups(channel))
+    pending_levelups[channel.id].append((user_id, level, xp))
+
+async def flush_levelups(channel):
+    """Announce a channel's queued level-ups as one message once the window closes"""
+    await asyncio.sleep(LEVELUP_FLUSH_DELAY)
+    levelups = pending_levelups.pop(channel.id, [])
+
+    if len(levelups) == 1:
+        user_id, level, xp = levelups[0]
+        embed = discord.Embed(
+            title="🎉 Level Up!",
+            description=f"Congratulations <@{user_id}>!",
+            color=discord.Color.green(),
+            timestamp=datetime.utcnow()
+        )
+        embed.add_field(name="New Level", value=level, inline=True)
+        embed.add_field(name="Total XP", value=xp, inline=True)
+        embeds = [embed]
+    else:
+        embeds = []
+        for i in range(0, len(levelups), LEVELUPS_PER_EMBED):
+            lines = [f"<@{user_id}> reached **level {level}** ({xp:,} XP)"
+                     for user_id, level, xp in levelups[i:i + LEVELUPS_PER_EMBED]]
+            embeds.append(discord.Embed(
+                title="🎉 Level Ups!",
+                description="\n".join(lines),
+                color=discord.Color.green(),
+                timestamp=datetime.utcnow()
+            ))
+
+    try:
+        # Embeds in one message share a 6000 character limit
+        for i in range(0, len(embeds), LEVELUP_EMBEDS_PER_MESSAGE):
+            await channel.send(embeds=embeds[i:i + LEVELUP_EMBEDS_PER_MESSAGE])
+    except discord.HTTPException as e:
+        logging.error(f"Failed to send level-up announcement: {str(e)}", extra={"fields": {
+            "event": "levelup_failed",
+            "channel_id": channel.id,
+            "error": str(e)
+        }})
+
+LOG_FILE = 'bot_commands.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file once it reaches this size
+LOG_MAX_AGE = 24 * 60 * 60  # Or once it has been written to for this many seconds
+LOG_BACKUP_COUNT = 14  # Compressed rotated files to keep
+
+class JsonLogFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including any structured fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def gzip_rotator(source, dest):
+    """Compress a rotated log file"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class SizeAndAgeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotate when the file grows past maxBytes or gets older than max_age, gzipping old files"""
+
+    def __init__(self, filename, max_bytes, max_age, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.max_age = max_age
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = gzip_rotator
+        self.started_file = f"{self.baseFilename}.started"  # Holds when the current file was started
+        self.opened_at = self.started_at()
+
+    def started_at(self):
+        """When the current file was started, so restarting the bot doesn't reset its age"""
+        # Filesystems don't reliably record creation times, so the start is kept in a sidecar file
+        if os.path.getsize(self.baseFilename):
+            try:
+                with open(self.started_file, 'r') as f:
+                    return float(f.read())
+            except (OSError, ValueError):
+                pass
+            # Files from before the sidecar: the newest backup was written by the rollover that started it
+            try:
+                started = os.stat(self.rotation_filename(f"{self.baseFilename}.1")).st_mtime
+            except FileNotFoundError:
+                started = time.time()
+        else:
+            started = time.time()
+        self.mark_started(started)
+        return started
+
+    def mark_started(self, started):
+        try:
+            with open(self.started_file, 'w') as f:
+                f.write(str(started))
+        except OSError:
+            pass  # Only costs an early rotation after a restart
+
+    def shouldRollover(self, record):
+        # An empty file isn't worth rotating however old it is
+        if self.stream and self.stream.tell() and time.time() - self.opened_at >= self.max_age:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+        self.mark_started(self.opened_at)
+
+# Handlers run on a listener thread, coroutines only put records on a queue
+stdout_handler = logging.StreamHandler(sys.stdout)
+stdout_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+file_handler = SizeAndAgeRotatingFileHandler(LOG_FILE, LOG_MAX_BYTES, LOG_MAX_AGE, LOG_BACKUP_COUNT)
+file_handler.setFormatter(JsonLogFormatter())
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, stdout_handler, file_handler)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))  # The listener's handlers do the real formatting
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot_commands.log')
-    ]
+    handlers=[queue_handler]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
+
+TRACE_FILE = 'traces.jsonl'
+TRACE_HISTORY = 20  # Recent traces kept in memory per command for the trace command
+TRACE_MAX_SPANS = 200  # Spans stored per trace, later ones only count towards the per-route totals
+
+# Traces get their own logger so they land in their own file, still written by the listener thread
+trace_handler = SizeAndAgeRotatingFileHandler(TRACE_FILE, LOG_MAX_BYTES, LOG_MAX_AGE, LOG_BACKUP_COUNT)
+trace_handler.setFormatter(logging.Formatter('%(message)s'))
+trace_queue = queue.SimpleQueue()
+trace_listener = logging.handlers.QueueListener(trace_queue, trace_handler)
+trace_logger = logging.getLogger('traces')
+trace_logger.propagate = False
+trace_logger.addHandler(logging.handlers.QueueHandler(trace_queue))
+trace_listener.start()
+atexit.register(trace_listener.stop)
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+recent_traces = defaultdict(lambda: deque(maxlen=TRACE_HISTORY))  # {command_name: deque[Trace]}
+
+class Trace:
+    """Root span for one command invocation, with child spans for REST calls and sleeps"""
+    __slots__ = ('trace_id', 'command', 'started_at', 'start', 'duration', 'status', 'spans', 'routes',
+                 'dropped_spans', 'finished')
+
+    def __init__(self, command):
+        self.trace_id = uuid.uuid4().hex
+        self.command = command
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.spans = []  # [(kind, name, offset, duration, status)], the first TRACE_MAX_SPANS only
+        self.routes = {}  # {(kind, name): [count, total seconds]} over every span
+        self.dropped_spans = 0
+        self.finished = False
+
+    def add_span(self, kind, name, start, end, status="ok"):
+        # Background tasks started by the command may outlive it
+        if self.finished:
+            return
+        route = self.routes.get((kind, name))
+        if route is None:
+            route = self.routes[(kind, name)] = [0, 0.0]
+        route[0] += 1
+        route[1] += end - start
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append((kind, name, start - self.start, end - start, status))
+        else:
+            self.dropped_spans += 1
+
+    def finish(self, status):
+        self.duration = time.perf_counter() - self.start
+        self.status = status
+        self.finished = True
+
+    def time_in(self, kind):
+        return sum(total for (route_kind, _), (_, total) in self.routes.items() if route_kind == kind)
+
+    def calls_to(self, kind):
+        return sum(count for (route_kind, _), (count, _) in self.routes.items() if route_kind == kind)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "command": self.command,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "status": self.status,
+            "spans": [{"kind": kind, "name": name, "offset": offset, "duration": duration, "status": status}
+                      for kind, name, offset, duration, status in self.spans],
+            "dropped_spans": self.dropped_spans,
+            "routes": [{"kind": kind, "name": name, "count": count, "duration": total}
+                       for (kind, name), (count, total) in self.routes.items()]
+        }
 
-async def send_log_dm(bot, log_message: str):
-    """Send log message to allowed user"""
+@contextmanager
+def trace_span(kind, name):
+    """Record the wrapped block as a span in the current trace, the yielded dict's status can be set"""
+    trace = current_trace.get()
+    span = {"status": "ok"}
+    start = time.perf_counter()
     try:
-        user = await bot.fetch_user(ALLOWED_USER_ID)
-        if user:
-            embed = discord.Embed(
-                title="🔍 Bot Log",
-                description=f"```\n{log_message}\n```",
-                color=discord.Color.blue(),
+        yield span
+    except discord.HTTPException as e:
+        span["status"] = str(e.status)
+        raise
+    except Exception:
+        span["status"] = "error"
+        raise
+    finally:
+        if trace is not None:
+            trace.add_span(kind, name, start, time.perf_counter(), span["status"])
+
+def trace_http_requests(http):
+    """Record every REST call made through the bot's HTTP client in the current trace"""
+    request = http.request
+
+    @wraps(request)
+    async def traced_request(route, **kwargs):
+        with trace_span("http", f"{route.method} {route.path}"):
+            return await request(route, **kwargs)
+
+    http.request = traced_request
+
+trace_http_requests(bot.http)
+
+async def traced_sleep(delay):
+    """asyncio.sleep that shows up as a span in the current trace"""
+    with trace_span("sleep", f"sleep {delay}s"):
+        await asyncio.sleep(delay)
+
+class LogShipper:
+    """Delivers log messages to the allowed user as digest DMs
+    Messages are batched until the digest is full or LOG_DIGEST_INTERVAL passes,
+    errors skip the batch and are sent straight away"""
+
+    def __init__(self):
+        self.owner = None  # Resolved once, then reused for every DM
+        self.buffer = []
+        self.buffer_chars = 0
+        self.flush_task = None
+
+    def ship(self, log_message, error=False):
+        if error:
+            create_task(self._send([log_message], error=True))
+            return
+
+        self.buffer.append(log_message)
+        self.buffer_chars += len(log_message)
+        if self.buffer_chars >= LOG_DIGEST_MAX_CHARS:
+            create_task(self.flush())
+        elif self.flush_task is None:
+            self.flush_task = create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(LOG_DIGEST_INTERVAL)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        entries, self.buffer, self.buffer_chars = self.buffer, [], 0
+        await self._send(entries)
+
+    async def _owner(self):
+        if self.owner is None:
+            self.owner = bot.get_user(ALLOWED_USER_ID) or await bot.fetch_user(ALLOWED_USER_ID)
+        return self.owner
+
+    async def _send(self, entries, error=False):
+        try:
+            # Pack entries into as few embeds as fit the description limit
+            chunks, chunk = [], ""
+            for entry in entries:
+                entry = entry[:LOG_DIGEST_MAX_CHARS]
+                if chunk and len(chunk) + len(entry) + 2 > LOG_DIGEST_MAX_CHARS:
+                    chunks.append(chunk)
+                    chunk = ""
+                chunk = f"{chunk}\n\n{entry}" if chunk else entry
+            chunks.append(chunk)
+
+            if error:
+                title = "⚠️ Bot Error"
+            elif len(entries) > 1:
+                title = f"🔍 Bot Log ({len(entries)} entries)"
+            else:
+                title = "🔍 Bot Log"
+            embeds = [discord.Embed(
+                title=title,
+                description=f"```\n{chunk}\n```",
+                color=discord.Color.red() if error else discord.Color.blue(),
                 timestamp=datetime.utcnow()
-            )
-            await user.send(embed=embed)
-    except Exception as e:
-        print(f"Failed to send log DM: {str(e)}")
+            ) for chunk in chunks]
+
+            owner = await self._owner()
+            # Embeds in one message share a 6000 character limit, so send them one at a time
+            for embed in embeds:
+                await owner.send(embed=embed)
+        except Exception as e:
+            logging.error(f"Failed to send log DM: {str(e)}", extra={"fields": {
+                "event": "log_dm_failed",
+                "error": str(e)
+            }})
+
+log_shipper = LogShipper()
+
+def send_log_dm(bot, log_message: str, error: bool = False):
+    """Queue a log message for the allowed user without waiting for delivery"""
+    log_shipper.ship(log_message, error=error)
 
 def parse_time(time_str: str) -> int:
     """Convert time string to seconds
@@ -153,12 +1125,35 @@ def log_command():
             )
             
             # Log to file
-            logging.info(log_message)
+            logging.info(log_message, extra={"fields": {
+                "event": "command",
+                "command": command_name,
+                "user": str(author),
+                "user_id": author.id,
+                "server": guild.name,
+                "server_id": guild.id,
+                "channel": channel.name,
+                "channel_id": channel.id,
+                "arguments": f"{args_str} {kwargs_str}".strip()
+            }})
             
             # Send DM to allowed user
-            await send_log_dm(ctx.bot, log_message)
+            send_log_dm(ctx.bot, log_message)
             
-            return await func(ctx, *args, **kwargs)
+            trace = Trace(command_name)
+            token = current_trace.set(trace)
+            status = "ok"
+            try:
+                return await func(ctx, *args, **kwargs)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                current_trace.reset(token)
+                trace.finish(status)
+                command_latency.observe(trace.duration, command=command_name, status=status)
+                recent_traces[command_name].append(trace)
+                trace_logger.info(json.dumps(trace.to_dict()))
         return wrapper
     return decorator
 
@@ -185,16 +1180,18 @@ async def auto_save():
         now = datetime.utcnow()
         if now - last_save_time >= AUTOSAVE_INTERVAL:
             try:
-                save_xp_data()
-                save_reaction_roles()
+                await xp_store.flush()
+                await save_reaction_roles()
+                if LOOKUP_CACHE_FILE:
+                    await lookup_caches_writer.request()
                 last_save_time = now
                 log_message = f"Auto-saved XP and reaction roles data at {now}"
-                print(log_message)
-                await send_log_dm(bot, log_message)
+                logging.info(log_message, extra={"fields": {"event": "auto_save"}})
+                send_log_dm(bot, log_message)
             except Exception as e:
                 error_message = f"Auto-save error at {now}: {str(e)}"
-                print(error_message)
-                await send_log_dm(bot, error_message)
+                logging.error(error_message, extra={"fields": {"event": "auto_save", "error": str(e)}})
+                send_log_dm(bot, error_message, error=True)
         
         await asyncio.sleep(60)  # Check every minute
 
@@ -246,6 +1243,187 @@ async def moderate(ctx, action: str, member: discord.Member, *, reason=None):
     except discord.Forbidden:
         await ctx.send("I don't have permission to do that!")
 
+PURGE_BULK_SIZE = 100  # Most messages Discord deletes in one bulk request
+PURGE_BULK_MAX_AGE = timedelta(days=14, minutes=-5)  # Older messages can't be bulk deleted, with a safety margin
+PURGE_SINGLE_DELETE_INTERVAL = 1.2  # Seconds between deletes of old messages, their bucket is much tighter
+PURGE_OLD_QUEUE_SIZE = 100  # Old messages waiting for the single-delete lane before history walking pauses
+PURGE_PROGRESS_INTERVAL = 5  # Seconds between progress message updates
+BULK_DELETE_TOO_OLD = 50034  # Discord error code when a bulk delete includes a message over 14 days old
+active_purges = {}  # {channel_id: PurgeJob}
+
+class PurgeJob:
+    """Streams a channel's history, bulk deleting young messages and deleting old ones one by one"""
+
+    def __init__(self, channel, progress, check=None, **history_kwargs):
+        self.channel = channel
+        self.progress = progress
+        self.check = check
+        self.history_kwargs = history_kwargs  # Passed to channel.history: limit, before, after
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self.cancelled = False
+        self.error = None  # First error from the single-delete lane
+        self.old_messages = None  # Queue feeding the single-delete lane while running
+        self.last_update = time.monotonic()
+
+    async def run(self):
+        old_messages = self.old_messages = asyncio.Queue(maxsize=PURGE_OLD_QUEUE_SIZE)
+        old_lane = create_task(self.delete_old(old_messages))
+        try:
+            batch = []
+            async for message in self.channel.history(**self.history_kwargs):
+                if self.cancelled or self.error:
+                    break
+                self.scanned += 1
+                await self.report()
+                if message.id == self.progress.id or (self.check and not self.check(message)):
+                    continue
+                
+                if message.created_at > discord.utils.utcnow() - PURGE_BULK_MAX_AGE:
+                    batch.append(message)
+                    if len(batch) == PURGE_BULK_SIZE:
+                        await self.delete_bulk(batch)
+                        batch = []
+                else:
+                    # Newest first, every later message is old too. Bulk delete the young
+                    # ones now, before waiting on the slow lane pushes them past the cutoff
+                    if batch:
+                        await self.delete_bulk(batch)
+                        batch = []
+                    await old_messages.put(message)
+            
+            if batch and not self.cancelled:
+                await self.delete_bulk(batch)
+            await old_messages.put(None)
+            await old_lane
+        finally:
+            old_lane.cancel()
+        
+        if self.error:
+            raise self.error
+
+    async def delete_bulk(self, batch):
+        try:
+            await self.channel.delete_messages(batch)
+            self.deleted += len(batch)
+        except discord.NotFound:
+            # Someone else deleted part of the batch, retry the rest on their own
+            for message in batch:
+                await self.delete_one(message)
+        except discord.HTTPException as e:
+            if e.code != BULK_DELETE_TOO_OLD:
+                raise
+            # Part of the batch aged past 14 days, hand it to the single-delete lane
+            for message in batch:
+                await self.old_messages.put(message)
+
+    async def delete_old(self, old_messages):
+        """Single-delete lane, paced separately so it never stalls the bulk deletes"""
+        while (message := await old_messages.get()) is not None:
+            if self.cancelled or self.error:
+                continue  # Drain so the history walk isn't left blocked on a full queue
+            try:
+                await self.delete_one(message)
+            except discord.HTTPException as e:
+                self.error = e
+                continue
+            await traced_sleep(PURGE_SINGLE_DELETE_INTERVAL)
+
+    async def delete_one(self, message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except discord.NotFound:
+            self.failed += 1
+
+    async def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_update < PURGE_PROGRESS_INTERVAL:
+            return
+        self.last_update = now
+        try:
+            await self.progress.edit(
+                content=f"🔄 Purging... scanned {self.scanned:,} messages, deleted {self.deleted:,}. "
+                        f"Use `{bot.command_prefix}purge cancel` to stop."
+            )
+        except discord.HTTPException:
+            pass
+
+LINK_PATTERN = re.compile(r'https?://\S+', re.IGNORECASE)
+
+def compile_purge_filter(terms, default_limit):
+    """
+    Compile purge where terms into one message predicate plus channel.history arguments
+    Terms are ANDed together, comma separated values inside one term are ORed
+    """
+    checks = []
+    history_kwargs = {}
+    limit = None
+    
+    for term in terms:
+        key, _, value = term.partition(':')
+        key = key.lower()
+        
+        if key == "from" and value:
+            try:
+                user_ids = frozenset(int(user.strip('<@!>')) for user in value.split(',') if user)
+            except ValueError:
+                raise ValueError(f"Invalid user in `{term}`")
+            checks.append(lambda m, user_ids=user_ids: m.author.id in user_ids)
+        elif key == "contains" and value:
+            texts = tuple(text.lower() for text in value.split(',') if text)
+            checks.append(lambda m, texts=texts: any(text in m.content.lower() for text in texts))
+        elif key == "regex" and value:
+            try:
+                pattern = re.compile(value, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Invalid regex `{value}`: {e}")
+            checks.append(lambda m, pattern=pattern: pattern.search(m.content) is not None)
+        elif key == "has" and value.lower() in ("attachment", "link"):
+            if value.lower() == "attachment":
+                checks.append(lambda m: bool(m.attachments))
+            else:
+                checks.append(lambda m: LINK_PATTERN.search(m.content) is not None)
+        elif key == "bot" and not value:
+            checks.append(lambda m: m.author.bot)
+        elif key in ("after", "before", "limit") and value.isdigit():
+            if key == "limit":
+                limit = int(value)
+            else:
+                history_kwargs[key] = discord.Object(id=int(value))
+        else:
+            raise ValueError(f"Unknown filter `{term}`")
+    
+    if not checks and not history_kwargs:
+        raise ValueError("Please specify at least one filter!")
+    
+    # A window that starts at a message is bounded already, otherwise stay within the safety limit
+    if limit is None and "after" not in history_kwargs:
+        limit = default_limit
+    history_kwargs["limit"] = limit
+    
+    check = (lambda m: all(condition(m) for condition in checks)) if checks else None
+    return check, history_kwargs
+
+async def run_purge(ctx, progress, summary, check=None, **history_kwargs):
+    """Run a PurgeJob in the channel and replace the progress message with its summary"""
+    if ctx.channel.id in active_purges:
+        await progress.edit(content="❌ A purge is already running in this channel! Use `!purge cancel` to stop it.")
+        return
+    
+    job = active_purges[ctx.channel.id] = PurgeJob(ctx.channel, progress, check, **history_kwargs)
+    try:
+        await job.run()
+    finally:
+        del active_purges[ctx.channel.id]
+    
+    if job.cancelled:
+        content = f"🛑 Purge cancelled after deleting {job.deleted:,} messages."
+    else:
+        content = f"✅ Purged {job.deleted:,} messages{summary}."
+    await progress.edit(content=content, delete_after=5)
+
 @bot.command()
 @admin_command()
 @log_command() 
@@ -259,11 +1437,25 @@ async def purge(ctx, option: str = None, *args):
     !purge between <msg_id1> <msg_id2>     - Purges messages between two messages
     !purge contains <text> [limit]          - Purges messages containing text
     !purge from @user [limit]              - Purges messages from specific user
+    !purge where <filters...>               - Purges messages matching every filter in one pass
+    !purge cancel                           - Stops the purge running in this channel
+    Filters for where: from:@a,@b contains:text,text regex:pattern has:attachment has:link
+    bot after:<message_id> before:<message_id> limit:<number>
+    Example: !purge where from:@user1,@user2 has:link after:123456789
     """
     try:
         # Default limit for safety
         default_limit = 100
         
+        if option and option.lower() == "cancel":
+            job = active_purges.get(ctx.channel.id)
+            if job is None:
+                await ctx.send("❌ No purge is running in this channel!")
+                return
+            job.cancelled = True
+            await ctx.send("🛑 Cancelling purge...", delete_after=5)
+            return
+        
         # Create progress message
         progress = await ctx.send("🔄 Processing purge request...")
         
@@ -279,12 +1471,9 @@ async def purge(ctx, option: str = None, *args):
                 return
                 
             amount = int(args[0])
-            if amount > 1000:
-                await progress.edit(content="❌ Cannot purge more than 1000 messages at once!")
-                return
-                
-            deleted = await ctx.channel.purge(limit=amount + 1)  # +1 for command message
-            await ctx.send(f"✅ Purged {len(deleted)-1} messages.", delete_after=5)
+            # The command message is removed too, but isn't counted as purged
+            await ctx.message.delete()
+            await run_purge(ctx, progress, "", before=ctx.message, limit=amount)
             
         elif option == "after":
             if not args:
@@ -295,8 +1484,7 @@ async def purge(ctx, option: str = None, *args):
             limit = int(args[1]) if len(args) > 1 else default_limit
             
             after_message = await ctx.channel.fetch_message(message_id)
-            deleted = await ctx.channel.purge(after=after_message, limit=limit)
-            await ctx.send(f"✅ Purged {len(deleted)} messages after specified message.", delete_after=5)
+            await run_purge(ctx, progress, " after specified message", after=after_message, limit=limit)
             
         elif option == "before":
             if not args:
@@ -307,8 +1495,7 @@ async def purge(ctx, option: str = None, *args):
             limit = int(args[1]) if len(args) > 1 else default_limit
             
             before_message = await ctx.channel.fetch_message(message_id)
-            deleted = await ctx.channel.purge(before=before_message, limit=limit)
-            await ctx.send(f"✅ Purged {len(deleted)} messages before specified message.", delete_after=5)
+            await run_purge(ctx, progress, " before specified message", before=before_message, limit=limit)
             
         elif option == "between":
             if len(args) < 2:
@@ -319,8 +1506,7 @@ async def purge(ctx, option: str = None, *args):
             msg1 = await ctx.channel.fetch_message(msg_id1)
             msg2 = await ctx.channel.fetch_message(msg_id2)
             
-            deleted = await ctx.channel.purge(after=msg1, before=msg2)
-            await ctx.send(f"✅ Purged {len(deleted)} messages between specified messages.", delete_after=5)
+            await run_purge(ctx, progress, " between specified messages", after=msg1, before=msg2, limit=None)
             
         elif option == "contains":
             if not args:
@@ -331,8 +1517,7 @@ async def purge(ctx, option: str = None, *args):
             limit = int(args[1]) if len(args) > 1 else default_limit
             
             check = lambda m: text in m.content.lower()
-            deleted = await ctx.channel.purge(limit=limit, check=check)
-            await ctx.send(f"✅ Purged {len(deleted)} messages containing '{text}'.", delete_after=5)
+            await run_purge(ctx, progress, f" containing '{text}'", check=check, limit=limit)
             
         elif option == "from":
             if not args:
@@ -342,12 +1527,21 @@ async def purge(ctx, option: str = None, *args):
             try:
                 user_id = int(args[0].strip('<@!>'))
                 limit = int(args[1]) if len(args) > 1 else default_limit
-                
-                check = lambda m: m.author.id == user_id
-                deleted = await ctx.channel.purge(limit=limit, check=check)
-                await ctx.send(f"✅ Purged {len(deleted)} messages from user.", delete_after=5)
             except ValueError:
                 await progress.edit(content="❌ Invalid user mention!")
+                return
+                
+            check = lambda m: m.author.id == user_id
+            await run_purge(ctx, progress, " from user", check=check, limit=limit)
+            
+        elif option == "where":
+            try:
+                check, history_kwargs = compile_purge_filter(args, default_limit)
+            except ValueError as e:
+                await progress.edit(content=f"❌ {e}")
+                return
+                
+            await run_purge(ctx, progress, " matching the filters", check=check, **history_kwargs)
                 
         else:
             await progress.edit(content="❌ Invalid purge option! Use `!help purge` for details.")
@@ -528,36 +1722,391 @@ async def roleinfo(ctx, role: discord.Role):
     except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
 
+class DeletedMessage:
+    """Compact record of a deleted message, without references to discord.py objects"""
+    __slots__ = ('author_id', 'author_name', 'content', 'attachments', 'created_at', 'deleted_at')
+
+    def __init__(self, author_id, author_name, content, attachments, created_at, deleted_at):
+        self.author_id = author_id
+        self.author_name = author_name
+        self.content = content
+        self.attachments = attachments  # Tuple of attachment URLs
+        self.created_at = created_at
+        self.deleted_at = deleted_at  # Monotonic seconds, for TTL eviction
+
+class SnipeStore:
+    """Ring buffer of deleted messages per channel with LRU and TTL eviction across channels"""
+
+    def __init__(self, depth, max_channels, ttl):
+        self.depth = depth
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.channels = OrderedDict()  # {channel_id: deque[DeletedMessage]}, least recently used first
+
+    def add(self, channel_id, record):
+        history = self.channels.get(channel_id)
+        if history is None:
+            history = self.channels[channel_id] = deque(maxlen=self.depth)
+        else:
+            self.channels.move_to_end(channel_id)
+        history.append(record)
+        self.expire()
+        while len(self.channels) > self.max_channels:
+            self.channels.popitem(last=False)
+
+    def get(self, channel_id, index):
+        """Return the index-th most recent deletion in a channel (1 is the latest), or None"""
+        self.expire()
+        history = self.channels.get(channel_id)
+        if history is None or not 1 <= index <= len(history):
+            return None
+        return history[-index]
+
+    def count(self, channel_id):
+        history = self.channels.get(channel_id)
+        return len(history) if history else 0
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for channel_id in list(self.channels):
+            history = self.channels[channel_id]
+            while history and history[0].deleted_at < cutoff:
+                history.popleft()
+            if not history:
+                del self.channels[channel_id]
+
+    def size(self):
+        return sum(len(history) for history in self.channels.values())
+
+snipe_store = SnipeStore(SNIPE_DEPTH, SNIPE_MAX_CHANNELS, SNIPE_TTL)
+
+class MessageCache:
+    """Recent message content per guild, kept under a byte budget, for deletes discord.py no longer has cached"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.guilds = {}  # {guild_id: OrderedDict{message_id: (channel_id, author_id, author_name, content, attachments)}}
+        self.used = defaultdict(int)  # {guild_id: estimated bytes}
+
+    @staticmethod
+    def record_size(record):
+        return (MESSAGE_CACHE_RECORD_OVERHEAD + len(record[3].encode())
+                + sum(len(url) for url in record[4]))
+
+    def add(self, message):
+        guild_id = message.guild.id
+        record = (
+            message.channel.id,
+            message.author.id,
+            sys.intern(message.author.display_name),  # Shared by every message from the same author
+            message.content,
+            tuple(attachment.url for attachment in message.attachments)
+        )
+        messages = self.guilds.get(guild_id)
+        if messages is None:
+            messages = self.guilds[guild_id] = OrderedDict()
+        messages[message.id] = record
+        self.used[guild_id] += self.record_size(record)
+        
+        # Oldest messages go first once the guild is over budget
+        while self.used[guild_id] > self.budget and messages:
+            _, evicted = messages.popitem(last=False)
+            self.used[guild_id] -= self.record_size(evicted)
+
+    def edit(self, guild_id, message_id, content):
+        messages = self.guilds.get(guild_id)
+        record = messages.get(message_id) if messages else None
+        if record is not None:
+            updated = record[:3] + (content,) + record[4:]
+            messages[message_id] = updated
+            self.used[guild_id] += self.record_size(updated) - self.record_size(record)
+
+    def pop(self, guild_id, message_id):
+        messages = self.guilds.get(guild_id)
+        record = messages.pop(message_id, None) if messages else None
+        if record is not None:
+            self.used[guild_id] -= self.record_size(record)
+        return record
+
+    def size(self):
+        return sum(self.used.values())
+
+message_cache = MessageCache(MESSAGE_CACHE_BUDGET)
+
 @bot.command()
 @is_allowed_user()
 @log_command() 
-async def snipe(ctx):
+async def snipe(ctx, index: int = 1):
     """
-    Shows the most recently deleted message in the channel
-    Usage: !snipe
+    Shows a recently deleted message in the channel, 1 being the latest
+    Usage: !snipe [n]
+    Example: !snipe 3
     """
-    message = deleted_messages[ctx.channel.id]
+    message = snipe_store.get(ctx.channel.id, index)
     
     if message is None:
-        await ctx.send("There are no recently deleted messages to snipe!")
+        available = snipe_store.count(ctx.channel.id)
+        if available and index > 1:
+            await ctx.send(f"❌ Only {available} deleted messages are remembered in this channel!")
+        else:
+            await ctx.send("There are no recently deleted messages to snipe!")
         return
         
     embed = discord.Embed(
-        title="📝 Deleted Message",
-        description=message['content'],
+        title="📝 Deleted Message" if index == 1 else f"📝 Deleted Message #{index}",
+        description=message.content,
         color=discord.Color.red(),
-        timestamp=message['timestamp']
+        timestamp=message.created_at
     )
     
-    embed.set_author(name=message['author'].name, icon_url=message['author'].display_avatar.url)
+    author = ctx.guild.get_member(message.author_id) if ctx.guild else None
+    if author:
+        embed.set_author(name=message.author_name, icon_url=author.display_avatar.url)
+    else:
+        embed.set_author(name=message.author_name)
     embed.set_footer(text=f"Message sent at")
     
     # If message had attachments, add them to the embed
-    if message['attachments']:
-        embed.add_field(name="Attachments", value="\n".join(message['attachments']), inline=False)
+    if message.attachments:
+        embed.add_field(name="Attachments", value="\n".join(message.attachments), inline=False)
     
     await ctx.send(embed=embed)
 
+class TriggerMatcher:
+    """Aho-Corasick automaton over a guild's autoresponder triggers
+    Finds the earliest-added trigger contained in a message in one pass"""
+
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+        self.goto = [{}]  # Trie transitions per state
+        self.fail = [0]
+        self.best = [len(self.triggers)]  # Lowest trigger index ending at each state, len() if none
+
+        for priority, trigger in enumerate(self.triggers):
+            state = 0
+            for char in trigger:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(len(self.triggers))
+                state = next_state
+            self.best[state] = min(self.best[state], priority)
+
+        # Breadth-first so each state's fail link is finished before its children
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.best[next_state] = min(self.best[next_state], self.best[self.fail[next_state]])
+                queue.append(next_state)
+
+    def match(self, content):
+        """Return the highest priority trigger found in content, or None"""
+        goto, fail, best_at = self.goto, self.fail, self.best
+        best = best_at[0]
+        state = 0
+        for char in content:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best_at[state] < best:
+                best = best_at[state]
+                if best == 0:
+                    break
+        return self.triggers[best] if best < len(self.triggers) else None
+
+    def to_dict(self):
+        return {"triggers": self.triggers, "goto": self.goto, "fail": self.fail, "best": self.best}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a matcher saved with to_dict without rebuilding it"""
+        matcher = cls.__new__(cls)
+        matcher.triggers = data["triggers"]
+        matcher.goto = data["goto"]
+        matcher.fail = data["fail"]
+        matcher.best = data["best"]
+        return matcher
+
+EMOJI_MODIFIERS = {'\u200d', '\ufe0e', '\ufe0f', '\u20e3'}  # Joiner, variation selectors, keycap
+# Code points that can start an emoji, for when the emoji package isn't installed
+# Exact below U+10000, where emoji share blocks with plain symbols, merged over small gaps above it
+EMOJI_RANGES = (
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049), (0x2122, 0x2122),
+    (0x2139, 0x2139), (0x2194, 0x2199), (0x21A9, 0x21AA), (0x231A, 0x231B), (0x2328, 0x2328),
+    (0x23CF, 0x23CF), (0x23E9, 0x23F3), (0x23F8, 0x23FA), (0x24C2, 0x24C2), (0x25AA, 0x25AB),
+    (0x25B6, 0x25B6), (0x25C0, 0x25C0), (0x25FB, 0x25FE), (0x2600, 0x2604), (0x260E, 0x260E),
+    (0x2611, 0x2611), (0x2614, 0x2615), (0x2618, 0x2618), (0x261D, 0x261D), (0x2620, 0x2620),
+    (0x2622, 0x2623), (0x2626, 0x2626), (0x262A, 0x262A), (0x262E, 0x262F), (0x2638, 0x263A),
+    (0x2640, 0x2640), (0x2642, 0x2642), (0x2648, 0x2653), (0x265F, 0x2660), (0x2663, 0x2663),
+    (0x2665, 0x2666), (0x2668, 0x2668), (0x267B, 0x267B), (0x267E, 0x267F), (0x2692, 0x2697),
+    (0x2699, 0x2699), (0x269B, 0x269C), (0x26A0, 0x26A1), (0x26A7, 0x26A7), (0x26AA, 0x26AB),
+    (0x26B0, 0x26B1), (0x26BD, 0x26BE), (0x26C4, 0x26C5), (0x26C8, 0x26C8), (0x26CE, 0x26CF),
+    (0x26D1, 0x26D1), (0x26D3, 0x26D4), (0x26E9, 0x26EA), (0x26F0, 0x26F5), (0x26F7, 0x26FA),
+    (0x26FD, 0x26FD), (0x2702, 0x2702), (0x2705, 0x2705), (0x2708, 0x270D), (0x270F, 0x270F),
+    (0x2712, 0x2712), (0x2714, 0x2714), (0x2716, 0x2716), (0x271D, 0x271D), (0x2721, 0x2721),
+    (0x2728, 0x2728), (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747), (0x274C, 0x274C),
+    (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757), (0x2763, 0x2764), (0x2795, 0x2797),
+    (0x27A1, 0x27A1), (0x27B0, 0x27B0), (0x27BF, 0x27BF), (0x2934, 0x2935), (0x2B05, 0x2B07),
+    (0x2B1B, 0x2B1C), (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x3030, 0x3030), (0x303D, 0x303D),
+    (0x3297, 0x3297), (0x3299, 0x3299), (0x1F004, 0x1F004), (0x1F0CF, 0x1F0CF), (0x1F170, 0x1F171),
+    (0x1F17E, 0x1F17F), (0x1F18E, 0x1F19A), (0x1F201, 0x1F202), (0x1F21A, 0x1F21A),
+    (0x1F22F, 0x1F23A), (0x1F250, 0x1F251), (0x1F300, 0x1F57A), (0x1F587, 0x1F596),
+    (0x1F5A4, 0x1F5C4), (0x1F5D1, 0x1F64F), (0x1F680, 0x1F6FC), (0x1F7E0, 0x1F7F0),
+    (0x1F90C, 0x1F9FF), (0x1FA70, 0x1FAF8)
+)
+EMOJI_RANGE_STARTS = [start for start, _ in EMOJI_RANGES]
+REACTION_INTERVAL = 0.25  # Seconds between reactions in one channel, Discord's reaction bucket
+REACTION_STALE_AFTER = 30  # Seconds before queued reactions are no longer worth adding
+
+def is_unicode_emoji(text):
+    """Check that text is a single unicode emoji, using the emoji package's table when it's installed"""
+    if emoji_data is not None:
+        return emoji_data.is_emoji(text)
+    if not text or len(text) > 16:
+        return False
+    if text[0] in '#*0123456789':
+        return text[1:] in ('\u20e3', '\ufe0f\u20e3')  # Keycap
+    if all(0x1F1E6 <= ord(char) <= 0x1F1FF for char in text):
+        return len(text) == 2  # Flag made of two regional indicators
+    
+    expect_symbol = True
+    for char in text:
+        code = ord(char)
+        if char == '\u200d':
+            expect_symbol = True  # Joiner, another symbol continues the same emoji
+            continue
+        if char in EMOJI_MODIFIERS or 0x1F3FB <= code <= 0x1F3FF or 0xE0020 <= code <= 0xE007F:
+            continue  # Variation selectors, skin tones and flag tags
+        if not expect_symbol:
+            return False  # A second emoji without a joiner
+        index = bisect.bisect_right(EMOJI_RANGE_STARTS, code) - 1
+        if index < 0 or code > EMOJI_RANGES[index][1]:
+            return False  # Not an emoji, asking for emoji presentation doesn't make it one
+        expect_symbol = False
+    return not expect_symbol
+
+def validate_emoji(guild, emoji):
+    """Check an emoji against the emoji cache, returns its reaction string or None if unusable"""
+    partial = discord.PartialEmoji.from_str(emoji)
+    if partial.id is None:
+        return emoji if is_unicode_emoji(emoji) else None
+    custom = discord.utils.get(guild.emojis, id=partial.id) or bot.get_emoji(partial.id)
+    return str(custom) if custom and custom.is_usable() else None
+
+class ReactionDispatcher:
+    """Adds autoresponder reactions through one paced queue per channel
+    A message that is already waiting has new emojis merged in instead of being queued again"""
+
+    def __init__(self):
+        self.queues = {}  # {channel_id: OrderedDict{message_id: [message, emojis, queued_at, trigger]}}
+        self.workers = {}  # {channel_id: Task}
+        self.in_flight = {}  # {channel_id: (message_id, emojis)} currently being added
+
+    def react(self, message, emojis, trigger=None):
+        channel_id = message.channel.id
+        in_flight = self.in_flight.get(channel_id)
+        if in_flight and in_flight[0] == message.id:
+            emojis = [emoji for emoji in emojis if emoji not in in_flight[1]]
+        if not emojis:
+            return
+
+        queue = self.queues.setdefault(channel_id, OrderedDict())
+        job = queue.get(message.id)
+        if job is not None:
+            job[1].extend(emoji for emoji in emojis if emoji not in job[1])
+        else:
+            queue[message.id] = [message, list(emojis), time.monotonic(), trigger]
+
+        if channel_id not in self.workers:
+            self.workers[channel_id] = create_task(self._run(channel_id))
+
+    def depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def _run(self, channel_id):
+        queue = self.queues[channel_id]
+        try:
+            while queue:
+                message_id, (message, emojis, queued_at, trigger) = queue.popitem(last=False)
+                if time.monotonic() - queued_at > REACTION_STALE_AFTER:
+                    continue
+                self.in_flight[channel_id] = (message_id, emojis)
+                for emoji in emojis:
+                    try:
+                        await message.add_reaction(emoji)
+                    except discord.NotFound:
+                        break  # Message was deleted
+                    except discord.HTTPException as e:
+                        logging.error(f"Failed to add reaction {emoji} for autoresponder '{trigger}': {str(e)}",
+                                      extra={"fields": {
+                                          "event": "reaction_failed",
+                                          "guild_id": message.guild.id if message.guild else None,
+                                          "trigger": trigger,
+                                          "emoji": emoji,
+                                          "error": str(e)
+                                      }})
+                        continue
+                    await asyncio.sleep(REACTION_INTERVAL)
+                del self.in_flight[channel_id]
+        finally:
+            self.in_flight.pop(channel_id, None)
+            del self.workers[channel_id]
+            if not queue:
+                del self.queues[channel_id]
+
+reaction_dispatcher = ReactionDispatcher()
+
+def compile_autoresponders(guild_id):
+    """Rebuild a guild's trigger matcher after its triggers change and save the rules"""
+    if autoresponders.get(guild_id):
+        autoresponder_matchers[guild_id] = TriggerMatcher(autoresponders[guild_id])
+    else:
+        autoresponder_matchers.pop(guild_id, None)
+    return save_autoresponders()
+
+def load_autoresponders():
+    """Load autoresponder rules and their compiled matchers from JSON file"""
+    rules, matchers = {}, {}
+    try:
+        with open('autoresponders.json', 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return rules, matchers
+
+    for guild_id, guild_data in data.items():
+        guild_id = int(guild_id)
+        rules[guild_id] = guild_data["rules"]
+        matcher = guild_data.get("matcher")
+        # Only trust the saved automaton if it was built from these exact triggers
+        if matcher and matcher["triggers"] == list(rules[guild_id]):
+            matchers[guild_id] = TriggerMatcher.from_dict(matcher)
+        elif rules[guild_id]:
+            matchers[guild_id] = TriggerMatcher(rules[guild_id])
+    return rules, matchers
+
+def snapshot_autoresponders():
+    """Copy autoresponder rules, matchers are never modified once built so they are shared"""
+    return [(guild_id, dict(rules), autoresponder_matchers.get(guild_id))
+            for guild_id, rules in autoresponders.items()]
+
+def write_autoresponders(snapshot):
+    data = {str(guild_id): {"rules": rules, "matcher": matcher.to_dict() if matcher else None}
+            for guild_id, rules, matcher in snapshot}
+    write_json_atomic('autoresponders.json', data)
+
+autoresponders_writer = SnapshotWriter("autoresponders", snapshot_autoresponders, write_autoresponders)
+
+def save_autoresponders():
+    """Save autoresponder rules to a JSON file without blocking the event loop"""
+    return autoresponders_writer.request()
+
 @bot.command()
 @admin_command()
 @log_command() 
@@ -569,7 +2118,9 @@ async def autoresponder(ctx, action: str, trigger: str = None, *, response: str
     !autoresponder react <trigger> <emojis>     - Add reaction response (space-separated emojis)
     !autoresponder remove <trigger>             - Remove autoresponder
     !autoresponder list                         - List all autoresponders
+    !autoresponder reload                       - Reload all autoresponders from disk
     """
+    global autoresponders, autoresponder_matchers
     guild_id = ctx.guild.id
     
     if guild_id not in autoresponders:
@@ -581,6 +2132,7 @@ async def autoresponder(ctx, action: str, trigger: str = None, *, response: str
             return
             
         autoresponders[guild_id][trigger.lower()] = {"type": "text", "response": response}
+        await compile_autoresponders(guild_id)
         embed = discord.Embed(
             title="✅ Autoresponder Added",
             color=discord.Color.green(),
@@ -595,26 +2147,17 @@ async def autoresponder(ctx, action: str, trigger: str = None, *, response: str
             await ctx.send("❌ Please provide both trigger and emojis!")
             return
             
-        # Split response into individual emojis
-        emojis = response.split()
-        
-        # Validate emojis
-        try:
-            # Test message to verify emojis
-            test_msg = await ctx.send("Testing emojis...")
-            for emoji in emojis:
-                try:
-                    await test_msg.add_reaction(emoji)
-                except:
-                    await test_msg.delete()
-                    await ctx.send(f"❌ Invalid emoji: {emoji}")
-                    return
-            await test_msg.delete()
-        except:
-            await ctx.send("❌ Failed to validate emojis!")
-            return
+        # Split response into individual emojis and validate them locally
+        emojis = []
+        for emoji in response.split():
+            valid_emoji = validate_emoji(ctx.guild, emoji)
+            if valid_emoji is None:
+                await ctx.send(f"❌ Invalid emoji: {emoji}")
+                return
+            emojis.append(valid_emoji)
             
         autoresponders[guild_id][trigger.lower()] = {"type": "reaction", "response": emojis}
+        await compile_autoresponders(guild_id)
         embed = discord.Embed(
             title="✅ Reaction Autoresponder Added",
             color=discord.Color.green(),
@@ -631,6 +2174,7 @@ async def autoresponder(ctx, action: str, trigger: str = None, *, response: str
             
         if trigger.lower() in autoresponders[guild_id]:
             del autoresponders[guild_id][trigger.lower()]
+            await compile_autoresponders(guild_id)
             await ctx.send(f"✅ Removed autoresponder for trigger: `{trigger}`")
         else:
             await ctx.send("❌ That trigger doesn't exist!")
@@ -657,8 +2201,19 @@ async def autoresponder(ctx, action: str, trigger: str = None, *, response: str
             
         await ctx.send(embed=embed)
         
+    elif action.lower() == "reload":
+        try:
+            # Parse and compile off the event loop, then swap both tables at once
+            rules, matchers = await asyncio.to_thread(load_autoresponders)
+        except Exception as e:
+            await ctx.send(f"❌ Failed to reload autoresponders: {str(e)}")
+            return
+        autoresponders, autoresponder_matchers = rules, matchers
+        total = sum(len(guild_rules) for guild_rules in rules.values())
+        await ctx.send(f"✅ Reloaded {total} autoresponders across {len(rules)} servers.")
+        
     else:
-        await ctx.send("❌ Invalid action! Use: add, react, remove, or list")
+        await ctx.send("❌ Invalid action! Use: add, react, remove, list, or reload")
 
 @bot.command()
 @admin_command()
@@ -769,67 +2324,291 @@ async def untimeout(ctx, member: discord.Member, *, reason: str = None):
     except Exception as e:
         await ctx.send(f"❌ An error occurred: {str(e)}")
 
+CLONE_MESSAGE_LIMIT = 2000  # Characters Discord allows in one webhook message
+CLONE_FILES_PER_MESSAGE = 10  # Attachments Discord allows in one webhook message
+CLONE_DOWNLOAD_WORKERS = 4  # Attachments downloaded at the same time when cloning with files
+CLONE_PREFETCH = 10  # Messages read ahead of the webhook posts, with their downloads running
+CLONE_SPOOL_MEMORY = 512 * 1024  # Bytes of an attachment kept in memory before spooling to disk
+CLONE_CHUNK_SIZE = 64 * 1024
+CLONE_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=HTTP_CONNECT_TIMEOUT, sock_read=30)  # Large files
+CLONE_CHECKPOINT_FILE = 'clone_checkpoints.json'
+clone_checkpoints = {}  # {source_channel_id: {"target", "limit", "scanned", "last_message_id", "cloned"}}
+
+def load_clone_checkpoints():
+    """Load checkpoints of interrupted clones from JSON file"""
+    try:
+        with open(CLONE_CHECKPOINT_FILE, 'r') as f:
+            return {int(channel_id): checkpoint for channel_id, checkpoint in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+clone_checkpoints_writer = SnapshotWriter(
+    "clone_checkpoints",
+    lambda: {str(channel_id): dict(checkpoint) for channel_id, checkpoint in clone_checkpoints.items()},
+    lambda data: write_json_atomic(CLONE_CHECKPOINT_FILE, data)
+)
+
+def format_clone_block(message, with_author, linked_attachments=None):
+    """Render a source message as text for the clone, the author is left out inside a packed post"""
+    content = message.content
+    if linked_attachments is None:
+        linked_attachments = message.attachments
+    
+    # Handle embeds
+    if message.embeds:
+        content += "\n[Message contained embeds]"
+    
+    # Handle attachments that aren't uploaded to the clone
+    if linked_attachments:
+        content += "\n" + "\n".join([f"[Attachment: {a.url}]" for a in linked_attachments])
+    
+    timestamp = message.created_at.strftime("%Y-%m-%d %H:%M:%S")
+    header = f"**{message.author.name} [{timestamp}]**" if with_author else f"**[{timestamp}]**"
+    return f"{header}\n{content}"
+
+class CloneReplay:
+    """Replays messages through a webhook, packing consecutive messages from one author into each post
+    discord.py's webhook client waits on the X-RateLimit headers, so posts go out as fast as the bucket allows"""
+
+    def __init__(self, webhook, checkpoint, upload_limit=0):
+        self.webhook = webhook
+        self.checkpoint = checkpoint  # Advanced after every post so an interrupted clone can resume
+        self.upload_limit = upload_limit  # Bytes of files Discord accepts in one post
+        self.author = None
+        self.parts = []
+        self.files = []  # discord.File uploads for the next post
+        self.file_bytes = 0
+        self.length = 0
+        self.pending = None  # (message_id, scanned) of the last message in parts
+        self.pending_count = 0
+        self.posts = 0
+
+    async def add(self, message, scanned, downloads=None):
+        # Attachments that couldn't be re-uploaded fall back to links
+        files, file_bytes, linked = [], 0, message.attachments
+        if downloads is not None:
+            results = dict(zip(downloads, await asyncio.gather(*downloads.values())))
+            linked = []
+            for attachment in message.attachments:
+                file = results.get(attachment)
+                # One post can't carry more than the upload limit, the rest of the message's files are linked
+                if file is not None and file_bytes + attachment.size <= self.upload_limit:
+                    files.append(file)
+                    file_bytes += attachment.size
+                else:
+                    if file is not None:
+                        file.close()
+                    linked.append(attachment)
+        
+        block = format_clone_block(message, with_author=False, linked_attachments=linked)
+        if self.parts and (message.author.id != self.author.id
+                           or self.length + 1 + len(block) > CLONE_MESSAGE_LIMIT
+                           or len(self.files) + len(files) > CLONE_FILES_PER_MESSAGE
+                           or self.file_bytes + file_bytes > self.upload_limit):
+            await self.flush()
+        if not self.parts:
+            self.author = message.author
+            block = format_clone_block(message, with_author=True, linked_attachments=linked)
+        
+        # A message too long for one post is split over several
+        while len(block) > CLONE_MESSAGE_LIMIT:
+            self.parts.append(block[:CLONE_MESSAGE_LIMIT])
+            block = block[CLONE_MESSAGE_LIMIT:]
+            await self.post()
+        
+        self.parts.append(block)
+        self.files += files
+        self.file_bytes += file_bytes
+        self.length += len(block) + (1 if len(self.parts) > 1 else 0)
+        self.pending = (message.id, scanned)
+        self.pending_count += 1
+
+    async def post(self):
+        files, self.files = self.files, []
+        self.file_bytes = 0
+        try:
+            # Webhook sends don't go through bot.http, so they're traced here
+            with trace_span("http", "POST /webhooks/{webhook_id}/{webhook_token}"):
+                if files:
+                    await self.webhook.send(content="\n".join(self.parts), username=self.author.name, files=files)
+                else:
+                    await self.webhook.send(content="\n".join(self.parts), username=self.author.name)
+        finally:
+            for file in files:
+                file.close()
+        self.posts += 1
+        self.parts = []
+        self.length = 0
+
+    async def flush(self):
+        if not self.parts:
+            return
+        await self.post()
+        if self.pending is not None:
+            self.checkpoint["last_message_id"], self.checkpoint["scanned"] = self.pending
+            self.checkpoint["cloned"] += self.pending_count
+            self.pending = None
+            self.pending_count = 0
+            clone_checkpoints_writer.request()
+
+class SpooledUpload(io.RawIOBase):
+    """File object over a SpooledTemporaryFile, which discord.File only accepts directly from Python 3.11"""
+
+    def __init__(self, spool):
+        self.spool = spool
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.spool.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.spool.seek(offset, whence)
+
+    def tell(self):
+        return self.spool.tell()
+
+    def close(self):
+        self.spool.close()
+        super().close()
+
+async def spool_attachment(attachment, workers):
+    """Download an attachment in chunks into a spooled temp file, returning a discord.File or None"""
+    async with workers:
+        spool = tempfile.SpooledTemporaryFile(max_size=CLONE_SPOOL_MEMORY)
+        file = None
+        try:
+            async with http_session.get(attachment.url, timeout=CLONE_DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(CLONE_CHUNK_SIZE):
+                    spool.write(chunk)
+            spool.seek(0)
+            file = discord.File(SpooledUpload(spool), filename=attachment.filename)
+            return file
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        finally:
+            # Failed and cancelled downloads must not leave their temp file open
+            if file is None:
+                spool.close()
+
+def discard_download(download):
+    """Cancel an attachment download, closing its file if it already finished"""
+    if not download.done():
+        download.cancel()
+    elif not download.cancelled() and download.exception() is None and download.result() is not None:
+        download.result().close()
+
 @bot.command()
 @admin_command()
 @log_command() 
-async def clonechannel(ctx, channel: discord.TextChannel = None, messages: int = 100):
+async def clonechannel(ctx, channel: discord.TextChannel = None, messages: int = 100, *options: str):
     """
     Creates a copy of a channel including recent messages
-    Usage: !clonechannel [#channel] [message_count]
+    Usage: !clonechannel [#channel] [message_count] [files] [resume]
     Example: !clonechannel #general 50
-    Default: Clones current channel, last 100 messages
+    Example: !clonechannel #general 50 files
+    Example: !clonechannel #general 50 resume
+    Default: Clones current channel, last 100 messages, attachments as links
+    files re-uploads attachments to the clone instead of linking them
     """
+    source_channel = channel or ctx.channel
+    options = {option.lower() for option in options}
     try:
-        source_channel = channel or ctx.channel
+        checkpoint = clone_checkpoints.get(source_channel.id)
+        resuming = "resume" in options
         
-        # Create progress message
-        progress = await ctx.send(f"🔄 Cloning channel {source_channel.mention}...")
-        
-        # Clone the channel
-        new_channel = await source_channel.clone(
-            name=f"{source_channel.name}-copy",
-            reason=f"Channel cloned by {ctx.author}"
-        )
-        
-        # Update progress
-        await progress.edit(content=f"📥 Fetching messages from {source_channel.mention}...")
-        
-        # Fetch messages from original channel (from newest to oldest)
-        message_list = []
-        async for message in source_channel.history(limit=messages, oldest_first=True):
-            if not message.author.bot:  # Skip bot messages
-                content = message.content
-                
-                # Handle embeds
-                if message.embeds:
-                    content += "\n[Message contained embeds]"
-                
-                # Handle attachments
-                if message.attachments:
-                    content += "\n" + "\n".join([f"[Attachment: {a.url}]" for a in message.attachments])
-                
-                message_list.append({
-                    'author': message.author.name,
-                    'content': content,
-                    'timestamp': message.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                })
+        if resuming:
+            new_channel = ctx.guild.get_channel(checkpoint["target"]) if checkpoint else None
+            if new_channel is None:
+                await ctx.send(f"❌ No interrupted clone of {source_channel.mention} to resume!")
+                return
+            progress = await ctx.send(f"🔄 Resuming clone of {source_channel.mention}...")
+        else:
+            # Create progress message
+            progress = await ctx.send(f"🔄 Cloning channel {source_channel.mention}...")
+            
+            # Clone the channel
+            new_channel = await source_channel.clone(
+                name=f"{source_channel.name}-copy",
+                reason=f"Channel cloned by {ctx.author}"
+            )
+            checkpoint = clone_checkpoints[source_channel.id] = {
+                "target": new_channel.id,
+                "limit": messages,
+                "scanned": 0,
+                "last_message_id": None,
+                "cloned": 0,
+                "files": "files" in options
+            }
+            await clone_checkpoints_writer.request()
         
         # Update progress
         await progress.edit(content=f"📤 Sending messages to new channel...")
         
+        # Walk history oldest first, resuming after the last message that was posted
+        history_kwargs = {"limit": checkpoint["limit"] - checkpoint["scanned"], "oldest_first": True}
+        if checkpoint["last_message_id"]:
+            history_kwargs["after"] = discord.Object(id=checkpoint["last_message_id"])
+        
         # Send messages to new channel using webhooks for proper attribution
         webhook = await new_channel.create_webhook(name="Message Cloner")
+        replay = CloneReplay(webhook, checkpoint, new_channel.guild.filesize_limit)
         
+        # History is read ahead of the posts so attachment downloads overlap with sending
+        upload_files = checkpoint.get("files", False)
+        workers = asyncio.Semaphore(CLONE_DOWNLOAD_WORKERS)
+        read_ahead = asyncio.Queue(maxsize=CLONE_PREFETCH)
+        
+        async def read_history():
+            try:
+                scanned = checkpoint["scanned"]
+                async for message in source_channel.history(**history_kwargs):
+                    scanned += 1
+                    if message.author.bot:  # Skip bot messages
+                        continue
+                    downloads = None
+                    if upload_files:
+                        downloads = {
+                            attachment: create_task(spool_attachment(attachment, workers))
+                            for attachment in message.attachments
+                            if attachment.size <= new_channel.guild.filesize_limit
+                        }
+                    try:
+                        await read_ahead.put((message, scanned, downloads))
+                    except asyncio.CancelledError:
+                        # Cancelled mid-put, this message's downloads never reached the queue
+                        for download in (downloads or {}).values():
+                            discard_download(download)
+                        raise
+            finally:
+                await read_ahead.put(None)
+        
+        reader = create_task(read_history())
         try:
-            for msg in message_list:
-                await webhook.send(
-                    content=f"**{msg['author']} [{msg['timestamp']}]**\n{msg['content']}",
-                    username=msg['author']
-                )
-                await asyncio.sleep(1)  # Avoid rate limits
+            while (item := await read_ahead.get()) is not None:
+                await replay.add(*item)
+            await reader
+            await replay.flush()
         finally:
+            reader.cancel()
+            while not read_ahead.empty():
+                item = read_ahead.get_nowait()
+                for download in (item[2] or {}).values() if item else ():
+                    discard_download(download)
+            # Let a cancelled reader discard the downloads it was still holding
+            await asyncio.gather(reader, return_exceptions=True)
             await webhook.delete()
         
+        clone_checkpoints.pop(source_channel.id, None)
+        await clone_checkpoints_writer.request()
+        
         # Create completion embed
         embed = discord.Embed(
             title="✅ Channel Cloned Successfully",
@@ -838,14 +2617,219 @@ async def clonechannel(ctx, channel: discord.TextChannel = None, messages: int =
             timestamp=datetime.utcnow()
         )
         embed.add_field(name="Original Channel", value=source_channel.mention, inline=True)
-        embed.add_field(name="Messages Cloned", value=len(message_list), inline=True)
+        embed.add_field(name="Messages Cloned", value=checkpoint["cloned"], inline=True)
+        embed.add_field(name="Webhook Posts", value=replay.posts, inline=True)
         
         await progress.edit(content=None, embed=embed)
         
     except discord.Forbidden:
         await ctx.send("❌ I don't have permission to manage channels or create webhooks!")
     except Exception as e:
-        await ctx.send(f"❌ An error occurred: {str(e)}")
+        hint = ""
+        if source_channel.id in clone_checkpoints:
+            hint = f" Use !clonechannel {source_channel.mention} {messages} resume to continue."
+        await ctx.send(f"❌ An error occurred: {str(e)}{hint}")
+
+EXPORT_DIR = getattr(config, 'EXPORT_DIR', 'exports')
+EXPORT_COMPRESSION = getattr(config, 'EXPORT_COMPRESSION', 'gzip')  # 'gzip' or 'zstd'
+EXPORT_SEGMENT_SIZE = 1000  # Messages compressed and written together, each segment is a checkpoint
+EXPORT_PROGRESS_INTERVAL = 5  # Seconds between progress message updates
+active_exports = set()  # Channel IDs being exported
+
+def message_to_record(message):
+    """Flatten a message into a JSON-serializable export record"""
+    return {
+        "id": message.id,
+        "channel_id": message.channel.id,
+        "author_id": message.author.id,
+        "author": message.author.name,
+        "bot": message.author.bot,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "attachments": [{"filename": a.filename, "url": a.url, "size": a.size} for a in message.attachments],
+        "embeds": len(message.embeds),
+        "reference": message.reference.message_id if message.reference else None,
+        "pinned": message.pinned
+    }
+
+def write_export_segment(path, offset, lines, compression, progress):
+    """Append one compressed segment at offset, dropping anything a crash left after it, then checkpoint"""
+    data = "".join(lines).encode()
+    if compression == "zstd":
+        data = zstandard.ZstdCompressor().compress(data)
+    else:
+        data = gzip.compress(data)
+    
+    # Segments are complete gzip members or zstd frames, which decompress as one concatenated stream
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        progress["offset"] = f.tell()
+    write_json_atomic(f"{path}.progress", progress)
+
+def load_export_progress(path):
+    """Load the checkpoint of an earlier export, or None"""
+    try:
+        with open(f"{path}.progress", 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+@bot.command()
+@admin_command()
+@log_command() 
+async def exportchannel(ctx, channel: discord.TextChannel = None, *options: str):
+    """
+    Exports a channel's history to a compressed JSON lines file on the bot's disk
+    Usage: !exportchannel [#channel] [limit] [resume]
+    Example: !exportchannel #general
+    Example: !exportchannel #general 50000 resume
+    resume continues after the last exported message instead of starting over
+    """
+    source_channel = channel or ctx.channel
+    limit = next((int(option) for option in options if option.isdigit()), None)
+    resuming = any(option.lower() == "resume" for option in options)
+    if source_channel.id in active_exports:
+        await ctx.send(f"❌ {source_channel.mention} is already being exported!")
+        return
+    
+    compression = "zstd" if EXPORT_COMPRESSION == "zstd" and zstandard else "gzip"
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{source_channel.id}.jsonl.{'zst' if compression == 'zstd' else 'gz'}")
+    
+    progress_data = load_export_progress(path) if resuming else None
+    if progress_data is None:
+        progress_data = {"last_message_id": None, "exported": 0, "offset": 0}
+    
+    # Walk history oldest first so the checkpoint only ever moves forward
+    history_kwargs = {"limit": limit, "oldest_first": True}
+    if progress_data["last_message_id"]:
+        history_kwargs["after"] = discord.Object(id=progress_data["last_message_id"])
+    
+    active_exports.add(source_channel.id)
+    try:
+        progress = await ctx.send(f"🔄 Exporting {source_channel.mention}...")
+        exported = progress_data["exported"]
+        lines = []
+        last_update = time.monotonic()
+        
+        async for message in source_channel.history(**history_kwargs):
+            lines.append(json.dumps(message_to_record(message)) + "\n")
+            if len(lines) == EXPORT_SEGMENT_SIZE:
+                exported += len(lines)
+                progress_data.update(last_message_id=message.id, exported=exported)
+                await asyncio.to_thread(write_export_segment, path, progress_data["offset"], lines, compression,
+                                        progress_data)
+                lines = []
+            
+            if time.monotonic() - last_update >= EXPORT_PROGRESS_INTERVAL:
+                last_update = time.monotonic()
+                await progress.edit(content=f"🔄 Exporting {source_channel.mention}... {exported + len(lines):,} messages")
+        
+        if lines:
+            exported += len(lines)
+            progress_data.update(last_message_id=message.id, exported=exported)
+            await asyncio.to_thread(write_export_segment, path, progress_data["offset"], lines, compression,
+                                    progress_data)
+        
+        embed = discord.Embed(
+            title="✅ Channel Exported Successfully",
+            color=discord.Color.green(),
+            timestamp=datetime.utcnow()
+        )
+        embed.add_field(name="Channel", value=source_channel.mention, inline=True)
+        embed.add_field(name="Messages Exported", value=f"{exported:,}", inline=True)
+        embed.add_field(name="File", value=f"`{path}` ({os.path.getsize(path) / 1024 / 1024:.1f} MB)"
+                        if os.path.exists(path) else "Nothing to export", inline=False)
+        
+        await progress.edit(content=None, embed=embed)
+        
+    except discord.Forbidden:
+        await ctx.send("❌ I don't have permission to read that channel's history!")
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred: {str(e)}. Use !exportchannel {source_channel.mention} resume to continue.")
+    finally:
+        active_exports.discard(source_channel.id)
+
+LOOKUP_CACHE_SIZE = 1000  # Terms cached per dictionary, least recently used are dropped first
+LOOKUP_CACHE_TTL = 6 * 60 * 60  # Seconds a found definition is reused
+LOOKUP_CACHE_NEGATIVE_TTL = 10 * 60  # Seconds a "no definition" result is reused
+LOOKUP_CACHE_FILE = getattr(config, 'LOOKUP_CACHE_FILE', None)  # Keep cached lookups across restarts when set
+
+def normalize_term(term):
+    """Cache key for a looked up term, ignoring case and extra whitespace"""
+    return " ".join(term.casefold().split())
+
+class ResponseCache:
+    """LRU cache of API responses with a TTL, None is cached as a negative result with a shorter TTL"""
+
+    def __init__(self, name, max_entries, ttl, negative_ttl):
+        self.name = name  # Label for lookup_cache_requests
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # {key: (expires_at, data)}, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (hit, data) for a key, data is None for a cached negative result"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            lookup_cache_requests.inc(cache=self.name, result="hit")
+            return True, entry[1]
+        if entry is not None:
+            del self.entries[key]
+        self.misses += 1
+        lookup_cache_requests.inc(cache=self.name, result="miss")
+        return False, None
+
+    def put(self, key, data):
+        ttl = self.ttl if data is not None else self.negative_ttl
+        self.entries[key] = (time.time() + ttl, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def snapshot(self):
+        now = time.time()
+        return [[key, expires_at, data] for key, (expires_at, data) in self.entries.items() if expires_at > now]
+
+    def restore(self, items):
+        now = time.time()
+        for key, expires_at, data in items:
+            if expires_at > now:
+                self.entries[key] = (expires_at, data)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+define_cache = ResponseCache("define", LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL, LOOKUP_CACHE_NEGATIVE_TTL)
+urban_cache = ResponseCache("urbandict", LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL, LOOKUP_CACHE_NEGATIVE_TTL)
+lookup_caches = [define_cache, urban_cache]
+
+def load_lookup_caches():
+    """Restore cached dictionary lookups from LOOKUP_CACHE_FILE"""
+    if not LOOKUP_CACHE_FILE:
+        return
+    try:
+        with open(LOOKUP_CACHE_FILE, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    for cache in lookup_caches:
+        cache.restore(data.get(cache.name, []))
+
+lookup_caches_writer = SnapshotWriter(
+    "lookup_caches",
+    lambda: {cache.name: cache.snapshot() for cache in lookup_caches},
+    lambda data: write_json_atomic(LOOKUP_CACHE_FILE, data)
+)
 
 @bot.command()
 @is_allowed_user()
@@ -857,52 +2841,60 @@ async def define(ctx, *, word: str):
     Example: !define python
     """
     try:
-        # Free dictionary API
-        url = f"https://api.dictionaryapi.dev/api/v2/entries/en/{word}"
+        # Free dictionary API, repeat lookups and unknown words are answered from the cache
+        key = normalize_term(word)
+        hit, data = define_cache.get(key)
+        if not hit:
+            url = f"https://api.dictionaryapi.dev/api/v2/entries/en/{key}"
+            with trace_span("http", "GET api.dictionaryapi.dev/api/v2/entries/en/{word}") as span:
+                async with http_session.get(url) as response:
+                    status = response.status
+                    if status == 200:
+                        data = await response.json()
+                    else:
+                        span["status"] = str(status)
+            if status not in (200, 404):
+                await ctx.send("❌ An error occurred while fetching the definition")
+                return
+            define_cache.put(key, data)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    embed = discord.Embed(
-                        title=f"📚 Definition of '{word}'",
-                        color=discord.Color.blue(),
-                        timestamp=datetime.utcnow()
-                    )
+        if data is not None:
+            embed = discord.Embed(
+                title=f"📚 Definition of '{word}'",
+                color=discord.Color.blue(),
+                timestamp=datetime.utcnow()
+            )
+            
+            # Get first entry's definitions
+            if data and isinstance(data, list):
+                entry = data[0]
+                
+                # Add phonetics if available
+                if "phonetic" in entry:
+                    embed.add_field(name="Pronunciation", value=entry["phonetic"], inline=False)
+                
+                # Add definitions
+                for meaning in entry.get("meanings", [])[:3]:  # Limit to 3 meanings
+                    part_of_speech = meaning.get("partOfSpeech", "unknown")
+                    definitions = meaning.get("definitions", [])
                     
-                    # Get first entry's definitions
-                    if data and isinstance(data, list):
-                        entry = data[0]
-                        
-                        # Add phonetics if available
-                        if "phonetic" in entry:
-                            embed.add_field(name="Pronunciation", value=entry["phonetic"], inline=False)
-                        
-                        # Add definitions
-                        for meaning in entry.get("meanings", [])[:3]:  # Limit to 3 meanings
-                            part_of_speech = meaning.get("partOfSpeech", "unknown")
-                            definitions = meaning.get("definitions", [])
+                    if definitions:
+                        definition = definitions[0]  # Get first definition
+                        value = f"**Definition:** {definition['definition']}\n"
+                        if "example" in definition:
+                            value += f"**Example:** *{definition['example']}*"
                             
-                            if definitions:
-                                definition = definitions[0]  # Get first definition
-                                value = f"**Definition:** {definition['definition']}\n"
-                                if "example" in definition:
-                                    value += f"**Example:** *{definition['example']}*"
-                                    
-                                embed.add_field(
-                                    name=f"({part_of_speech})",
-                                    value=value,
-                                    inline=False
-                                )
-                    
-                    await ctx.send(embed=embed)
-                    
-                elif response.status == 404:
-                    await ctx.send(f"❌ No definition found for '{word}'")
-                else:
-                    await ctx.send("❌ An error occurred while fetching the definition")
-                    
+                        embed.add_field(
+                            name=f"({part_of_speech})",
+                            value=value,
+                            inline=False
+                        )
+            
+            await ctx.send(embed=embed)
+            
+        else:
+            await ctx.send(f"❌ No definition found for '{word}'")
+            
     except Exception as e:
         await ctx.send(f"❌ An error occurred: {str(e)}")
 
@@ -916,52 +2908,59 @@ async def urbandict(ctx, *, term: str):
     Example: !urbandict yeet
     """
     try:
-        # Urban Dictionary API
-        url = "https://api.urbandictionary.com/v0/define"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params={"term": term}) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if (data["list"]):
-                        # Get the highest voted definition
-                        definition = max(data["list"], key=lambda x: x["thumbs_up"])
-                        
-                        embed = discord.Embed(
-                            title=f"🏙️ Urban Dictionary: {term}",
-                            url=definition["permalink"],
-                            color=discord.Color.dark_green(),
-                            timestamp=datetime.utcnow()
-                        )
-                        
-                        # Clean up the definition text
-                        def_text = definition["definition"][:1024]  # Discord limit
-                        example = definition["example"][:1024]
-                        
-                        embed.add_field(name="Definition", value=def_text, inline=False)
-                        if example:
-                            embed.add_field(name="Example", value=f"*{example}*", inline=False)
-                            
-                        embed.add_field(
-                            name="👍 Upvotes",
-                            value=definition["thumbs_up"],
-                            inline=True
-                        )
-                        embed.add_field(
-                            name="👎 Downvotes",
-                            value=definition["thumbs_down"],
-                            inline=True
-                        )
-                        
-                        embed.set_footer(text=f"By {definition['author']}")
-                        
-                        await ctx.send(embed=embed)
+        # Urban Dictionary API, only the highest voted definition is cached
+        key = normalize_term(term)
+        hit, definition = urban_cache.get(key)
+        if not hit:
+            url = "https://api.urbandictionary.com/v0/define"
+            with trace_span("http", "GET api.urbandictionary.com/v0/define") as span:
+                async with http_session.get(url, params={"term": key}) as response:
+                    status = response.status
+                    if status == 200:
+                        data = await response.json()
                     else:
-                        await ctx.send(f"❌ No Urban Dictionary definition found for '{term}'")
-                else:
-                    await ctx.send("❌ An error occurred while fetching from Urban Dictionary")
-                    
+                        span["status"] = str(status)
+            if status != 200:
+                await ctx.send("❌ An error occurred while fetching from Urban Dictionary")
+                return
+            
+            # Get the highest voted definition
+            definition = max(data["list"], key=lambda x: x["thumbs_up"]) if data["list"] else None
+            urban_cache.put(key, definition)
+        
+        if definition is not None:
+            embed = discord.Embed(
+                title=f"🏙️ Urban Dictionary: {term}",
+                url=definition["permalink"],
+                color=discord.Color.dark_green(),
+                timestamp=datetime.utcnow()
+            )
+            
+            # Clean up the definition text
+            def_text = definition["definition"][:1024]  # Discord limit
+            example = definition["example"][:1024]
+            
+            embed.add_field(name="Definition", value=def_text, inline=False)
+            if example:
+                embed.add_field(name="Example", value=f"*{example}*", inline=False)
+                
+            embed.add_field(
+                name="👍 Upvotes",
+                value=definition["thumbs_up"],
+                inline=True
+            )
+            embed.add_field(
+                name="👎 Downvotes",
+                value=definition["thumbs_down"],
+                inline=True
+            )
+            
+            embed.set_footer(text=f"By {definition['author']}")
+            
+            await ctx.send(embed=embed)
+        else:
+            await ctx.send(f"❌ No Urban Dictionary definition found for '{term}'")
+                
     except Exception as e:
         await ctx.send(f"❌ An error occurred: {str(e)}")
 
@@ -1016,8 +3015,8 @@ async def help(ctx, command_name: str = None):
     # Show categorized help menu
     categories = {
         "🛡️ Moderation": ["moderate", "timeout", "untimeout", "purge", "lockdown", "unlock", "dm"],
-        "👥 User Management": ["add_role", "remove_role", "clonechannel"],
-        "ℹ️ Information": ["serverinfo", "userinfo", "roleinfo", "avatar", "ping"],
+        "👥 User Management": ["add_role", "remove_role", "clonechannel", "exportchannel"],
+        "ℹ️ Information": ["serverinfo", "userinfo", "roleinfo", "avatar", "ping", "stagestats", "trace"],
         "🔍 Utility": ["define", "urbandict", "translate", "snipe"],
         "⚙️ Configuration": ["autoresponder"]
     }
@@ -1099,14 +3098,21 @@ async def reactionrole(ctx, message_id: str, emoji: str, role: discord.Role):
     except Exception as e:
         await ctx.send(f"❌ An error occurred: {str(e)}")
 
+def snapshot_reaction_roles():
+    """Copy reaction roles, converting all keys to strings for JSON serialization"""
+    return {str(msg_id): {str(emoji): role_id 
+            for emoji, role_id in roles.items()}
+            for msg_id, roles in reaction_roles.items()}
+
+reaction_roles_writer = SnapshotWriter(
+    "reaction_roles",
+    snapshot_reaction_roles,
+    lambda data: write_json_atomic('reaction_roles.json', data)
+)
+
 def save_reaction_roles():
-    """Save reaction roles to a JSON file"""
-    with open('reaction_roles.json', 'w') as f:
-        # Convert all keys to strings for JSON serialization
-        data = {str(msg_id): {str(emoji): role_id 
-               for emoji, role_id in roles.items()}
-               for msg_id, roles in reaction_roles.items()}
-        json.dump(data, f)
+    """Save reaction roles to a JSON file without blocking the event loop"""
+    return reaction_roles_writer.request()
 
 def load_reaction_roles():
     """Load reaction roles from JSON file"""
@@ -1129,7 +3135,7 @@ async def save(ctx):
     Usage: !save
     """
     try:
-        save_reaction_roles()
+        await save_reaction_roles()
         await ctx.send("✅ Reaction roles configuration has been saved!")
     except Exception as e:
         await ctx.send(f"❌ Failed to save configuration: {str(e)}")
@@ -1195,7 +3201,7 @@ async def tempchannel(ctx, channel_type: str, duration: str, *, name: str):
         await progress.edit(content=None, embed=embed)
         
         # Schedule channel deletion
-        await asyncio.sleep(seconds)
+        await traced_sleep(seconds)
         
         try:
             await new_channel.delete(reason="Temporary channel duration expired")
@@ -1376,7 +3382,7 @@ async def coinflip(ctx, bet: str = None):
 
         # Create suspense message
         msg = await ctx.send("🪙 Flipping the coin...")
-        await asyncio.sleep(1.5)
+        await traced_sleep(1.5)
 
         # Determine result
         result = choice(['heads', 'tails'])
@@ -1489,19 +3495,18 @@ async def rank(ctx, member: discord.Member = None):
     guild_id = ctx.guild.id
     user_id = member.id
     
-    if (guild_id not in xp_data or 
-        user_id not in xp_data[guild_id]):
+    user_data = await xp_store.get(guild_id, user_id)
+    if user_data is None:
         await ctx.send(f"{member.display_name} hasn't earned any XP yet!")
         return
     
-    user_data = xp_data[guild_id][user_id]
-    
     # Calculate progress to next level
-    current_level_xp = (user_data["level"] ** 2) * 100
-    next_level_xp = ((user_data["level"] + 1) ** 2) * 100
+    current_level_xp = (user_data.level ** 2) * 100
+    next_level_xp = ((user_data.level + 1) ** 2) * 100
     xp_needed = next_level_xp - current_level_xp
-    xp_progress = user_data["xp"] - current_level_xp
+    xp_progress = user_data.xp - current_level_xp
     progress_percent = (xp_progress / xp_needed) * 100
+    position, total_users = await xp_store.position(guild_id, user_id)
     
     embed = discord.Embed(
         title=f"🏆 Rank Card - {member.display_name}",
@@ -1509,8 +3514,10 @@ async def rank(ctx, member: discord.Member = None):
         timestamp=datetime.utcnow()
     )
     embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="Level", value=user_data["level"], inline=True)
-    embed.add_field(name="Total XP", value=user_data["xp"], inline=True)
+    embed.add_field(name="Level", value=user_data.level, inline=True)
+    embed.add_field(name="Total XP", value=user_data.xp, inline=True)
+    if position is not None:
+        embed.add_field(name="Rank", value=f"#{position:,} of {total_users:,}", inline=True)
     embed.add_field(name="Progress to Next Level", 
                    value=f"{xp_progress}/{xp_needed} XP ({progress_percent:.1f}%)", 
                    inline=False)
@@ -1527,25 +3534,18 @@ async def leaderboard(ctx, page: int = 1):
     Example: !leaderboard 2
     """
     guild_id = ctx.guild.id
-    if guild_id not in xp_data:
+    total_users = await xp_store.count(guild_id)
+    if not total_users:
         await ctx.send("No XP data for this server yet!")
         return
     
-    # Sort users by XP
-    sorted_users = sorted(
-        xp_data[guild_id].items(),
-        key=lambda x: x[1]["xp"],
-        reverse=True
-    )
-    
     # Paginate results (10 per page)
-    pages = (len(sorted_users) + 9) // 10
+    pages = (total_users + 9) // 10
     if page < 1 or page > pages:
         await ctx.send("Invalid page number!")
         return
     
     start_idx = (page - 1) * 10
-    end_idx = start_idx + 10
     
     embed = discord.Embed(
         title=f"🏆 XP Leaderboard - {ctx.guild.name}",
@@ -1554,10 +3554,10 @@ async def leaderboard(ctx, page: int = 1):
         timestamp=datetime.utcnow()
     )
     
-    for idx, (user_id, user_data) in enumerate(sorted_users[start_idx:end_idx], start=start_idx + 1):
+    for idx, (user_id, user_data) in enumerate(await xp_store.top(guild_id, start_idx, 10), start=start_idx + 1):
         member = ctx.guild.get_member(user_id)
         name = member.display_name if member else f"User {user_id}"
-        value = f"Level {user_data['level']} | {user_data['xp']} XP"
+        value = f"Level {user_data.level} | {user_data.xp} XP"
         embed.add_field(
             name=f"{idx}. {name}",
             value=value,
@@ -1584,21 +3584,14 @@ async def givexp(ctx, member: discord.Member, amount: int):
         guild_id = ctx.guild.id
         user_id = member.id
 
-        # Initialize guild/user data if needed
-        if guild_id not in xp_data:
-            xp_data[guild_id] = {}
-        if user_id not in xp_data[guild_id]:
-            xp_data[guild_id][user_id] = {
-                "xp": 0,
-                "level": 0,
-                "last_msg": None
-            }
-
         # Add XP and calculate new level
-        user_data = xp_data[guild_id][user_id]
-        old_level = user_data["level"]
-        user_data["xp"] += amount
-        user_data["level"] = calculate_level(user_data["xp"])
+        user_data = await xp_store.get_or_create(guild_id, user_id)
+        old_level = user_data.level
+        user_data.xp += amount
+        user_data.level = calculate_level(user_data.xp)
+
+        # Persist the XP change
+        xp_store.update(guild_id, user_id, user_data)
 
         # Create response embed
         embed = discord.Embed(
@@ -1610,33 +3603,70 @@ async def givexp(ctx, member: discord.Member, amount: int):
         
         embed.add_field(
             name="New Total XP", 
-            value=f"{user_data['xp']:,}", 
+            value=f"{user_data.xp:,}", 
             inline=True
         )
         embed.add_field(
             name="New Level",
-            value=str(user_data["level"]),
+            value=str(user_data.level),
             inline=True
         )
 
         # Check for level up
-        if user_data["level"] > old_level:
+        if user_data.level > old_level:
             embed.add_field(
                 name="Level Up!",
-                value=f"User advanced from level {old_level} to {user_data['level']}!",
+                value=f"User advanced from level {old_level} to {user_data.level}!",
                 inline=False
             )
 
         await ctx.send(embed=embed)
-        
-        # Save XP data
-        save_xp_data()
 
     except ValueError:
         await ctx.send("❌ Please provide a valid number for XP amount!")
     except Exception as e:
         await ctx.send(f"❌ An error occurred: {str(e)}")
 
+@bot.command()
+@admin_command()
+@log_command()
+async def levelupchannel(ctx, setting: str = None):
+    """
+    Choose where level-up announcements are sent
+    Usage: !levelupchannel [#channel/off/reset]
+    Example: !levelupchannel #level-ups
+    Default: Announces in the channel where the member leveled up
+    """
+    guild_id = ctx.guild.id
+
+    if setting is None:
+        channel_id = levelup_channels.get(guild_id)
+        if channel_id == 0:
+            await ctx.send("🔕 Level-up announcements are turned off.")
+        elif channel_id:
+            await ctx.send(f"📢 Level-ups are announced in <#{channel_id}>.")
+        else:
+            await ctx.send("📢 Level-ups are announced in the channel where they happen.")
+        return
+
+    if setting.lower() == "off":
+        levelup_channels[guild_id] = 0
+        message = "🔕 Level-up announcements turned off."
+    elif setting.lower() == "reset":
+        levelup_channels.pop(guild_id, None)
+        message = "📢 Level-ups will be announced in the channel where they happen."
+    else:
+        try:
+            channel = await commands.TextChannelConverter().convert(ctx, setting)
+        except commands.BadArgument:
+            await ctx.send("❌ Please mention a text channel, or use `off` or `reset`!")
+            return
+        levelup_channels[guild_id] = channel.id
+        message = f"📢 Level-ups will be announced in {channel.mention}."
+
+    await levelup_channels_writer.request()
+    await ctx.send(message)
+
 
 
 
@@ -1679,6 +3709,7 @@ async def givexp(ctx, member: discord.Member, amount: int):
 
 
 @bot.event
+@timed_event
 async def on_raw_reaction_add(payload):
     """Handle reaction role addition"""
     try:
@@ -1716,14 +3747,22 @@ async def on_raw_reaction_add(payload):
                     if channel:
                         await channel.send(f"❌ I don't have permission to assign the {role.name} role!")
                 except Exception as e:
-                    print(f"Error in reaction role add: {str(e)}")
-                    await send_log_dm(bot, f"Error in reaction role add: {str(e)}")
+                    error_message = f"Error in reaction role add: {str(e)}"
+                    logging.error(error_message, extra={"fields": {
+                        "event": "reaction_role_add",
+                        "server_id": payload.guild_id,
+                        "user_id": payload.user_id,
+                        "message_id": payload.message_id,
+                        "error": str(e)
+                    }})
+                    send_log_dm(bot, error_message, error=True)
     except Exception as e:
         error_message = f"Error in reaction role add: {str(e)}"
-        print(error_message)
-        await send_log_dm(bot, error_message)
+        logging.error(error_message, extra={"fields": {"event": "reaction_role_add", "error": str(e)}})
+        send_log_dm(bot, error_message, error=True)
 
 @bot.event
+@timed_event
 async def on_raw_reaction_remove(payload):
     """Handle reaction role removal"""
     try:
@@ -1761,103 +3800,377 @@ async def on_raw_reaction_remove(payload):
                     if channel:
                         await channel.send(f"❌ I don't have permission to remove the {role.name} role!")
                 except Exception as e:
-                    print(f"Error in reaction role remove: {str(e)}")
-                    await send_log_dm(bot, f"Error in reaction role remove: {str(e)}")
+                    error_message = f"Error in reaction role remove: {str(e)}"
+                    logging.error(error_message, extra={"fields": {
+                        "event": "reaction_role_remove",
+                        "server_id": payload.guild_id,
+                        "user_id": payload.user_id,
+                        "message_id": payload.message_id,
+                        "error": str(e)
+                    }})
+                    send_log_dm(bot, error_message, error=True)
     except Exception as e:
         error_message = f"Error in reaction role remove: {str(e)}"
-        print(error_message)
-        await send_log_dm(bot, error_message)
+        logging.error(error_message, extra={"fields": {"event": "reaction_role_remove", "error": str(e)}})
+        send_log_dm(bot, error_message, error=True)
+
+class MessageStage:
+    """One step of the on_message pipeline with its timing counters"""
+    __slots__ = ('name', 'handler', 'predicate', 'calls', 'skips', 'errors', 'total_time', 'max_time')
+
+    def __init__(self, name, handler, predicate):
+        self.name = name
+        self.handler = handler
+        self.predicate = predicate  # Cheap check, the stage is skipped when it returns False
+        self.calls = 0
+        self.skips = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+message_stages = []  # [MessageStage] in the order on_message runs them
+
+def message_stage(name, predicate=None):
+    """Register a coroutine as an on_message stage, it may return True to stop later stages"""
+    def decorator(func):
+        message_stages.append(MessageStage(name, func, predicate))
+        return func
+    return decorator
+
+XP_QUEUE_SIZE = 10000  # XP events waiting for the worker, more are dropped during raids
+XP_WORKER_BATCH = 500  # XP events applied per batch before yielding to the loop
+xp_events = asyncio.Queue(maxsize=XP_QUEUE_SIZE)  # (guild_id, user_id, timestamp, channel_id)
+xp_events_dropped = 0
+xp_worker_task = None
+
+async def award_xp(guild_id, user_id, now, channel_id):
+    """Apply one message's XP gain, respecting the cooldown, returns whether XP was awarded"""
+    # Check cooldown
+    user_data = await xp_store.get_or_create(guild_id, user_id)
+    if user_data.last_msg is None or now - user_data.last_msg >= XP_COOLDOWN:
+        
+        # Award XP
+        xp_gained = random.randint(MIN_XP, MAX_XP)
+        old_level = user_data.level
+        user_data.xp += xp_gained
+        user_data.level = calculate_level(user_data.xp)
+        user_data.last_msg = now
+        
+        # Persist the XP change, auto_save flushes whatever is still pending
+        xp_store.update(guild_id, user_id, user_data)
+        
+        # Check for level up
+        if user_data.level > old_level:
+            queue_levelup(guild_id, channel_id, user_id, user_data.level, user_data.xp)
+        return True
+    return False
+
+async def xp_worker():
+    """Apply queued XP events in micro-batches, away from the gateway handler"""
+    while True:
+        batch = [await xp_events.get()]
+        while len(batch) < XP_WORKER_BATCH and not xp_events.empty():
+            batch.append(xp_events.get_nowait())
+        
+        # Later events from a user inside the cooldown of XP awarded in this batch can't earn XP
+        awarded = {}
+        for guild_id, user_id, timestamp, channel_id in batch:
+            last_awarded = awarded.get((guild_id, user_id))
+            if last_awarded is not None and timestamp - last_awarded < XP_COOLDOWN:
+                continue
+            try:
+                if await award_xp(guild_id, user_id, timestamp, channel_id):
+                    awarded[(guild_id, user_id)] = timestamp
+            except Exception as e:
+                logging.error(f"Error applying XP: {str(e)}", extra={"fields": {
+                    "event": "xp_failed",
+                    "guild_id": guild_id,
+                    "user_id": user_id,
+                    "error": str(e)
+                }})
+        
+        await asyncio.sleep(0)
+
+@message_stage("message_cache", predicate=lambda message: MESSAGE_CACHE_ENABLED and message.guild is not None)
+async def message_cache_stage(message):
+    message_cache.add(message)
+
+@message_stage("xp", predicate=lambda message: message.guild is not None)
+async def xp_stage(message):
+    global xp_events_dropped
+    try:
+        xp_events.put_nowait((message.guild.id, message.author.id, time.time(), message.channel.id))
+    except asyncio.QueueFull:
+        xp_events_dropped += 1
+
+@message_stage("autoresponders",
+               predicate=lambda message: message.guild is not None and message.guild.id in autoresponder_matchers)
+async def autoresponder_stage(message):
+    guild_id = message.guild.id
+    trigger = autoresponder_matchers[guild_id].match(message.content.lower())
+    autoresponder_checks.inc()
+    if trigger is not None:
+        autoresponder_matches.inc()
+        data = autoresponders[guild_id][trigger]
+        if data["type"] == "text":
+            await message.channel.send(data["response"])
+        else:  # reaction type
+            reaction_dispatcher.react(message, data["response"], trigger)
+
+@message_stage("commands", predicate=lambda message: message.content.startswith(bot.command_prefix))
+async def command_stage(message):
+    await bot.process_commands(message)
 
 @bot.event
+@timed_event
 async def on_message(message):
     # Ignore bot messages
     if message.author.bot:
         return
     
-    # Handle XP system
-    if message.guild:  # Only track XP for server messages
-        guild_id = message.guild.id
-        user_id = message.author.id
-        
-        # Initialize guild/user data if needed
-        if guild_id not in xp_data:
-            xp_data[guild_id] = {}
-        if user_id not in xp_data[guild_id]:
-            xp_data[guild_id][user_id] = {
-                "xp": 0,
-                "level": 0,
-                "last_msg": None
-            }
+    for stage in message_stages:
+        if stage.predicate is not None and not stage.predicate(message):
+            stage.skips += 1
+            continue
         
-        # Check cooldown
-        user_data = xp_data[guild_id][user_id]
-        now = datetime.utcnow()
-        if (user_data["last_msg"] is None or 
-            (now - user_data["last_msg"]).total_seconds() >= XP_COOLDOWN):
-            
-            # Award XP
-            xp_gained = random.randint(MIN_XP, MAX_XP)
-            old_level = user_data["level"]
-            user_data["xp"] += xp_gained
-            user_data["level"] = calculate_level(user_data["xp"])
-            user_data["last_msg"] = now
-            
-            # Check for level up
-            if user_data["level"] > old_level:
-                embed = discord.Embed(
-                    title="🎉 Level Up!",
-                    description=f"Congratulations {message.author.mention}!",
-                    color=discord.Color.green(),
-                    timestamp=datetime.utcnow()
-                )
-                embed.add_field(name="New Level", value=user_data["level"], inline=True)
-                embed.add_field(name="Total XP", value=user_data["xp"], inline=True)
-                await message.channel.send(embed=embed)
-            
-            # Save XP data periodically
-            if random.random() < 0.1:  # 10% chance to save on each message
-                save_xp_data()
+        start = time.perf_counter()
+        try:
+            stop = await stage.handler(message)
+        except Exception as e:
+            stage.errors += 1
+            stop = False
+            logging.error(f"Error in {stage.name} message stage: {str(e)}", extra={"fields": {
+                "event": "message_stage_failed",
+                "stage": stage.name,
+                "guild_id": message.guild.id if message.guild else None,
+                "error": str(e)
+            }})
+        elapsed = time.perf_counter() - start
+        stage.calls += 1
+        stage.total_time += elapsed
+        stage.max_time = max(stage.max_time, elapsed)
+        
+        if stop:
+            break
+
+@bot.command()
+@is_allowed_user()
+@log_command()
+async def stagestats(ctx):
+    """
+    Shows how much time each on_message stage has taken
+    Usage: !stagestats
+    """
+    embed = discord.Embed(
+        title="⏱️ Message Pipeline Stats",
+        color=discord.Color.blue(),
+        timestamp=datetime.utcnow()
+    )
+    for stage in message_stages:
+        average = stage.total_time / stage.calls * 1000 if stage.calls else 0
+        embed.add_field(
+            name=stage.name,
+            value=(
+                f"Runs: {stage.calls:,} | Skipped: {stage.skips:,} | Errors: {stage.errors:,}\n"
+                f"Avg: {average:.2f} ms | Max: {stage.max_time * 1000:.2f} ms | "
+                f"Total: {stage.total_time:.1f} s"
+            ),
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
+@bot.command()
+@is_allowed_user()
+@log_command()
+async def trace(ctx, action: str, command_name: str, count: int = 5):
+    """
+    Summarizes recent traces of a command, split into REST calls, sleeps and bot code
+    Usage: !trace last <command> [count]
+    Example: !trace last clonechannel 3
+    """
+    if action.lower() != "last":
+        await ctx.send("❌ Invalid action! Use: last")
+        return
     
-    # Process autoresponders (your existing code)
-    guild_id = message.guild.id
-    if guild_id in autoresponders:
-        content = message.content.lower()
-        for trigger, data in autoresponders[guild_id].items():
-            if trigger in content:
-                if data["type"] == "text":
-                    await message.channel.send(data["response"])
-                else:  # reaction type
-                    for emoji in data["response"]:
-                        try:
-                            await message.add_reaction(emoji)
-                        except:
-                            continue
-                break
+    command = bot.get_command(command_name)
+    traces = list(recent_traces.get(command.name if command else command_name, []))[-count:]
+    if not traces:
+        await ctx.send(f"❌ No traces recorded for `{command_name}` yet!")
+        return
     
-    # Process commands
-    await bot.process_commands(message)
+    embed = discord.Embed(
+        title=f"🧭 Last {len(traces)} traces of {command_name}",
+        color=discord.Color.blue(),
+        timestamp=datetime.utcnow()
+    )
+    
+    endpoints = defaultdict(float)  # {endpoint: total seconds}
+    for trace in reversed(traces):
+        http_time = trace.time_in("http")
+        sleep_time = trace.time_in("sleep")
+        own_time = max(trace.duration - http_time - sleep_time, 0)
+        http_calls = trace.calls_to("http")
+        embed.add_field(
+            name=f"{datetime.utcfromtimestamp(trace.started_at).strftime('%Y-%m-%d %H:%M:%S')} UTC ({trace.status})",
+            value=(
+                f"Total: {trace.duration:.2f}s\n"
+                f"REST: {http_time:.2f}s over {http_calls} calls | "
+                f"Sleeping: {sleep_time:.2f}s | Bot code: {own_time:.2f}s"
+            ),
+            inline=False
+        )
+        for (kind, name), (count, total) in trace.routes.items():
+            if kind == "http":
+                endpoints[name] += total
+    
+    if endpoints:
+        embed.add_field(
+            name="Slowest REST endpoints",
+            value="\n".join(f"`{name}` {duration:.2f}s" for name, duration in sorted(endpoints.items(), key=lambda item: item[1], reverse=True)[:5]),
+            inline=False
+        )
+    
+    await ctx.send(embed=embed)
 
 @bot.event
 async def on_message_delete(message):
     if message.author.bot:
         return
-    deleted_messages[message.channel.id] = {
-        'author': message.author,
-        'content': message.content,
-        'timestamp': message.created_at,
-        'attachments': [attachment.url for attachment in message.attachments]
-    }
+    snipe_store.add(message.channel.id, DeletedMessage(
+        message.author.id,
+        message.author.display_name,
+        message.content,
+        tuple(attachment.url for attachment in message.attachments),
+        message.created_at,
+        time.monotonic()
+    ))
+
+@bot.event
+@timed_event
+async def on_raw_message_delete(payload):
+    if payload.guild_id is None:
+        return
+    record = message_cache.pop(payload.guild_id, payload.message_id)
+    # on_message_delete already handled messages discord.py still had cached
+    if record is None or payload.cached_message is not None:
+        return
+    channel_id, author_id, author_name, content, attachments = record
+    snipe_store.add(channel_id, DeletedMessage(
+        author_id,
+        author_name,
+        content,
+        attachments,
+        discord.utils.snowflake_time(payload.message_id),
+        time.monotonic()
+    ))
+
+@bot.event
+async def on_raw_message_edit(payload):
+    if payload.guild_id is not None and 'content' in payload.data:
+        message_cache.edit(payload.guild_id, payload.message_id, payload.data['content'])
+
+CallbackMetric("bot_xp_store_size", "Entries held by the XP store", "gauge", "kind", lambda: xp_store.size())
+CallbackMetric("bot_queue_depth", "Items waiting in internal queues", "gauge", "queue", lambda: {
+    "xp_events": xp_events.qsize(),
+    "reactions": reaction_dispatcher.depth(),
+    "levelups": sum(len(levelups) for levelups in pending_levelups.values()),
+    "log_digest": len(log_shipper.buffer)
+})
+CallbackMetric("bot_snipe_messages", "Deleted messages held for snipe", "gauge", "store",
+               lambda: {"snipe": snipe_store.size()})
+CallbackMetric("bot_lookup_cache_entries", "Entries held by the dictionary lookup caches", "gauge", "cache",
+               lambda: {cache.name: len(cache.entries) for cache in lookup_caches})
+CallbackMetric("bot_message_cache_bytes", "Estimated bytes held by the raw message cache", "gauge", "store",
+               lambda: {"message_cache": message_cache.size()})
+CallbackMetric("bot_xp_events_dropped_total", "XP events dropped because the queue was full", "counter", "queue",
+               lambda: {"xp_events": xp_events_dropped})
+CallbackMetric("bot_message_stage_seconds_total", "Time spent in each on_message stage", "counter", "stage",
+               lambda: {stage.name: stage.total_time for stage in message_stages})
+CallbackMetric("bot_message_stage_runs_total", "Messages handled by each on_message stage", "counter", "stage",
+               lambda: {stage.name: stage.calls for stage in message_stages})
+
+metrics_runner = None
+
+def create_http_session():
+    """Create the shared HTTP client, pooling keep-alive connections and caching DNS per host"""
+    connector = aiohttp.TCPConnector(
+        limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        enable_cleanup_closed=True
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def close_http_session_on_shutdown(client):
+    """Close the shared HTTP client when the bot shuts down"""
+    close = client.close
+
+    @wraps(close)
+    async def close_with_session():
+        if http_session is not None and not http_session.closed:
+            await http_session.close()
+        await close()
+
+    client.close = close_with_session
+
+close_http_session_on_shutdown(bot)
+
+def render_metrics():
+    """Render every metric in the Prometheus text format"""
+    lines = []
+    for metric in metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+async def start_metrics_server():
+    """Serve /metrics for a local Prometheus scraper"""
+    global metrics_runner
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logging.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics", extra={"fields": {
+        "event": "metrics_started",
+        "port": METRICS_PORT
+    }})
+
+@bot.event
+async def setup_hook():
+    # Runs once before the bot connects, so no command can see these unset
+    global http_session, clone_checkpoints
+    http_session = create_http_session()
+    # Running clones hold their checkpoint dicts, so the table must never be replaced later
+    clone_checkpoints = load_clone_checkpoints()
+    # Load (and migrate) XP before any rank or leaderboard command can touch the store
+    xp_store.load()
 
 @bot.event
 async def on_ready():
-    global reaction_roles, xp_data
+    global reaction_roles, levelup_channels, autoresponders, autoresponder_matchers, xp_worker_task
     reaction_roles = load_reaction_roles()
-    xp_data = load_xp_data()
-    print(f'Bot is ready! Logged in as {bot.user.name}')
+    levelup_channels = load_levelup_channels()
+    load_lookup_caches()
+    autoresponders, autoresponder_matchers = load_autoresponders()
+    logging.info(f'Bot is ready! Logged in as {bot.user.name}', extra={"fields": {
+        "event": "ready",
+        "servers": len(bot.guilds)
+    }})
     await bot.change_presence(activity=discord.Game(name="!help"))
     
     # Start auto-save task
     create_task(auto_save())
+    
+    # Start the XP worker once, on_ready runs again after reconnects
+    if xp_worker_task is None:
+        xp_worker_task = create_task(xp_worker())
+    
+    if METRICS_PORT and metrics_runner is None:
+        await start_metrics_server()
 
 COMMAND_LIST = """
 # Bot Commands List
@@ -1874,7 +4187,8 @@ COMMAND_LIST = """
 ## 👥 User Management
 - `!add_role <@user> <@role>` - Add a role to a user
 - `!remove_role <@user> <@role>` - Remove a role from a user
-- `!clonechannel [#channel] [message_count]` - Clone a channel with messages
+- `!clonechannel [#channel] [message_count] [files] [resume]` - Clone a channel with messages
+- `!exportchannel [#channel] [limit] [resume]` - Export a channel's history to a compressed file
 
 ## ℹ️ Information Commands
 - `!serverinfo` - Display server information
@@ -1883,12 +4197,14 @@ COMMAND_LIST = """
 - `!avatar [@user]` - Show user's avatar
 - `!ping` - Check bot's latency
 - `!servers` - Show information about all servers the bot is in
+- `!stagestats` - Show time spent in each message handling stage
+- `!trace last <command> [count]` - Summarize recent traces of a command
 
 ## 🔍 Utility Commands
 - `!define <word>` - Get word definition
 - `!urbandict <term>` - Look up term on Urban Dictionary
 - `!translate <lang_code> <text>` - Translate text
-- `!snipe` - Show last deleted message
+- `!snipe [n]` - Show a recently deleted message
 - `!tempchannel <type> <duration> <name>` - Create temporary channel
 - `!invite [duration_hours] [max_uses]` - Create invite link
 - `!coinflip [heads/tails]` - Play a coin flip game
@@ -1903,6 +4219,7 @@ COMMAND_LIST = """
 - `!rank [@user]` - Check XP rank and level
 - `!leaderboard [page]` - Show server XP leaderboard
 - `!givexp @user <amount>` - Give XP to a user (Admin only)
+- `!levelupchannel [#channel/off/reset]` - Choose where level-ups are announced (Admin only)
 
 ## 💡 Help
 - `!help [command]` - Show help menu or command details